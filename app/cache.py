@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from .connections import subscribe_forever
+
+
+class Cache():
+    """
+    Optional in-process LRU cache with a TTL, used by the managers for
+    reads. Entries are grouped by scope, a list or a profile, so a write
+    drops everything that was read from it. Writes are broadcast on a
+    Redis channel so that every worker drops its copy, and the TTL bounds
+    how stale an entry can get if a broadcast is missed. Settings are read
+    from `<config_prefix>_ENABLED`, `_MAX_SIZE` and `_TTL`.
+
+    Entries can be tagged with the version of the scope they were read at.
+    A get that passes the version it just read misses on any other, so a
+    response whose ETag is that version never gets a body from before it,
+    even if this worker has not yet heard of the write.
+
+    Without Redis (STORAGE other than redis) there is no channel to listen
+    on, so writes only drop this worker's copy and other workers rely on
+    the TTL.
+    """
+    channel = 'cache:invalidate'
+    poll_interval = 0.05
+
+    def __init__(self, db, config_prefix='CACHE'):
+        self.db = db
+        self.config_prefix = config_prefix
+        self.enabled = False
+        self.max_size = 0
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.scopes = {}
+        self.lock = threading.Lock()
+        self.local = False
+        self.listener = None
+
+    def init_app(self, app):
+        key = lambda suffix: '%s_%s' % (self.config_prefix, suffix)
+        self.enabled = app.config.get(key('ENABLED'), False)
+        self.max_size = app.config.get(key('MAX_SIZE'), 10000)
+        self.ttl = app.config.get(key('TTL'), 5)
+        self.local = app.config.get('STORAGE', 'redis') != 'redis'
+        if self.enabled and not self.local and self.listener is None:
+            self.listener = threading.Thread(target=self._listen)
+            self.listener.daemon = True
+            self.listener.start()
+
+    def get(self, scope, key, version=None):
+        """Returns the cached value, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.pop((scope, key), None)
+            if entry is None or entry[0] < time.time() or \
+                    (version is not None and entry[2] != version):
+                if entry is not None:
+                    self._discard_key(scope, key)
+                self.misses += 1
+                return None
+            self.entries[(scope, key)] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, scope, key, value, version=None):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries.pop((scope, key), None)
+            self.entries[(scope, key)] = (time.time() + self.ttl, value,
+                version)
+            self.scopes.setdefault(scope, set()).add(key)
+            while len(self.entries) > self.max_size:
+                (old_scope, old_key), _ = self.entries.popitem(last=False)
+                self._discard_key(old_scope, old_key)
+                self.evictions += 1
+
+    def invalidate(self, scope):
+        """Drops a scope here and tells the other workers to do the same."""
+        if not self.enabled:
+            return
+        self._discard_scope(scope)
+        if not self.local:
+            self.db.publish(self.channel, scope)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.scopes.clear()
+
+    def _discard_key(self, scope, key):
+        keys = self.scopes.get(scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.scopes[scope]
+
+    def _discard_scope(self, scope):
+        with self.lock:
+            for key in self.scopes.pop(scope, ()):
+                self.entries.pop((scope, key), None)
+
+    def _listen(self):
+        subscribe_forever(self.db, self._subscribe, self._handle, self.clear,
+            self.poll_interval)
+
+    def _subscribe(self, pubsub):
+        pubsub.subscribe(self.channel)
+        # Anything published while we were not subscribed is lost.
+        self.clear()
+
+    def _handle(self, message):
+        if message['type'] == 'message':
+            self._discard_scope(message['data'])
@@ -0,0 +1,209 @@
+"""
+Redis client configuration: connection pool size, socket timeouts, connect
+retries with backoff, a read replica for GET requests and Sentinel
+discovery. Redis Cluster clients manage their own connections and take
+their pool size and timeouts as ClusterRedis arguments.
+"""
+import time
+from flask import has_request_context, request, g
+from redis import StrictRedis, ConnectionPool
+from redis.client import StrictPipeline
+from redis.connection import UnixDomainSocketConnection
+from redis.exceptions import ConnectionError, RedisError
+from redis.sentinel import Sentinel, SentinelConnectionPool, \
+    SentinelManagedConnection
+from rediscluster import StrictRedisCluster
+from .metrics import InstrumentedConnection
+
+
+# Commands a replica can serve. Anything else, including scripts, goes to
+# the primary.
+READ_COMMANDS = frozenset([
+    'EXISTS', 'GET', 'HGET', 'HGETALL', 'HMGET', 'MGET', 'SCAN', 'TTL',
+    'ZCARD', 'ZRANGE', 'ZRANGEBYSCORE', 'ZREVRANGE', 'ZREVRANGEBYSCORE',
+    'ZSCORE',
+])
+
+
+# Connection arguments the replica URL sets, and those only TCP
+# connections take.
+ADDRESS_KWARGS = ('host', 'port', 'db', 'password', 'path')
+TCP_KWARGS = ('socket_connect_timeout', 'socket_keepalive',
+    'socket_keepalive_options')
+
+
+class RetryingConnection(InstrumentedConnection):
+    """
+    Retries failed connects with exponential backoff, so a Redis restart or
+    failover does not fail requests outright. Commands are never resent
+    once written, since the task scripts are not idempotent.
+    """
+    def __init__(self, connect_retries=0, retry_backoff=0.05, **kwargs):
+        super(RetryingConnection, self).__init__(**kwargs)
+        self.connect_retries = connect_retries
+        self.retry_backoff = retry_backoff
+
+    def connect(self):
+        attempt = 0
+        while True:
+            try:
+                return super(RetryingConnection, self).connect()
+            except ConnectionError:
+                if attempt >= self.connect_retries:
+                    raise
+                time.sleep(self.retry_backoff * 2 ** attempt)
+                attempt += 1
+
+
+class RetryingUnixConnection(RetryingConnection, UnixDomainSocketConnection):
+    """A RetryingConnection over a Unix socket, for `unix://` URLs."""
+
+
+class SentinelConnection(RetryingConnection, SentinelManagedConnection):
+    """A RetryingConnection that asks Sentinel where to connect."""
+
+
+class ReplicatedPipeline(StrictPipeline):
+    """
+    Runs on `replica` if every queued command is a read and on the primary
+    otherwise, since a pipeline may also write, e.g. a search's temporary
+    result set.
+    """
+    replica = None
+
+    def execute(self, raise_on_error=True):
+        if not all(args[0] in READ_COMMANDS
+                for args, _ in self.command_stack):
+            return super(ReplicatedPipeline, self).execute(raise_on_error)
+        pipe = self.replica.pipeline(transaction=False)
+        pipe.command_stack = self.command_stack
+        try:
+            return pipe.execute(raise_on_error)
+        finally:
+            self.reset()
+
+
+class ReplicatedRedis(StrictRedis):
+    """
+    Sends the read-only commands and non-transactional read-only pipelines
+    of GET requests to `replica`, when there is one, and everything else to
+    the primary.
+    """
+    replica = None
+
+    def execute_command(self, *args, **options):
+        if args[0] in READ_COMMANDS and self._use_replica():
+            return self.replica.execute_command(*args, **options)
+        return super(ReplicatedRedis, self).execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        if not transaction and self._use_replica():
+            pipe = ReplicatedPipeline(self.connection_pool,
+                self.response_callbacks, transaction, shard_hint)
+            pipe.replica = self.replica
+            return pipe
+        return super(ReplicatedRedis, self).pipeline(transaction, shard_hint)
+
+    def _use_replica(self):
+        return self.replica is not None and has_request_context() and \
+            request.method in ('GET', 'HEAD') and \
+            not g.get('read_from_primary', False)
+
+
+class ClusterRedis(StrictRedisCluster):
+    """
+    StrictRedisCluster with its pool size and timeouts as named arguments,
+    since flask_redis only passes on the `REDIS_*` settings a client's
+    __init__ names.
+    """
+    def __init__(self, host=None, port=None, password=None,
+            max_connections=32, socket_timeout=None,
+            socket_connect_timeout=None):
+        super(ClusterRedis, self).__init__(host=host, port=port,
+            password=password, max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout)
+
+
+def read_from_primary():
+    """Sends the rest of the current request's reads to the primary."""
+    g.read_from_primary = True
+
+
+def subscribe_forever(db, subscribe, handle, reset, poll_interval):
+    """
+    Keeps a pub/sub subscription open, as the target of a daemon thread.
+    `subscribe` is called with a new PubSub, again after any Redis error,
+    and `handle` with each message. `reset` is called whenever the
+    subscription drops, since messages may have been missed, including if
+    the thread dies.
+    """
+    try:
+        while True:
+            try:
+                pubsub = db.pubsub()
+                subscribe(pubsub)
+                # Polled rather than blocking on listen(), which would give
+                # up after REDIS_SOCKET_TIMEOUT without a message.
+                while True:
+                    message = pubsub.get_message()
+                    if message is None:
+                        time.sleep(poll_interval)
+                    else:
+                        handle(message)
+            except RedisError:
+                reset()
+                time.sleep(1)
+    finally:
+        reset()
+
+
+def init_redis(app, redis):
+    config = app.config
+    if config.get('REDIS_CLUSTER'):
+        # flask_redis has passed the pool size and timeouts to ClusterRedis.
+        return
+    client = redis.connection
+    kwargs = dict(client.connection_pool.connection_kwargs,
+        connect_retries=config['REDIS_CONNECT_RETRIES'],
+        retry_backoff=config['REDIS_RETRY_BACKOFF'])
+    max_connections = config['REDIS_MAX_CONNECTIONS']
+    replica = None
+    if config.get('REDIS_SENTINELS'):
+        sentinel = Sentinel(parse_addresses(config['REDIS_SENTINELS']),
+            socket_timeout=kwargs.get('socket_timeout'))
+        service = config['REDIS_SENTINEL_SERVICE']
+        client.connection_pool = SentinelConnectionPool(service, sentinel,
+            connection_class=SentinelConnection,
+            max_connections=max_connections, **kwargs)
+        replica = StrictRedis(connection_pool=SentinelConnectionPool(service,
+            sentinel, is_master=False, connection_class=SentinelConnection,
+            max_connections=max_connections, **kwargs))
+    else:
+        client.connection_pool = ConnectionPool(
+            connection_class=retrying_class('path' in kwargs),
+            max_connections=max_connections, **kwargs)
+        if config.get('REDIS_REPLICA_URL'):
+            replica_url = config['REDIS_REPLICA_URL']
+            unix_socket = replica_url.startswith('unix://')
+            skipped = ADDRESS_KWARGS + (TCP_KWARGS if unix_socket else ())
+            replica_kwargs = dict((name, value)
+                for name, value in kwargs.iteritems() if name not in skipped)
+            replica = StrictRedis(connection_pool=ConnectionPool.from_url(
+                replica_url, connection_class=retrying_class(unix_socket),
+                max_connections=max_connections, **replica_kwargs))
+    if replica is not None:
+        client.replica = replica
+
+
+def retrying_class(unix_socket):
+    return RetryingUnixConnection if unix_socket else RetryingConnection
+
+
+def parse_addresses(addresses):
+    """Parses `host:port,host:port` into (host, port) pairs."""
+    pairs = []
+    for address in addresses.split(','):
+        host, port = address.strip().rsplit(':', 1)
+        pairs.append((host, int(port)))
+    return pairs
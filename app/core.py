@@ -1,34 +1,100 @@
-import os
-from flask import make_response, jsonify
+from flask import make_response, request, g
 from flask.ext.httpauth import HTTPBasicAuth
 from flask_redis import Redis
-from .models import IndexManager, TaskValidator, ProfileValidator
-from tasks.models import TaskManager
-from profiles.models import ProfileManager
+from flask.ext.sqlalchemy import SQLAlchemy
+from .cache import Cache
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .responses import json_response
+from .models import IndexManager, SearchIndex, ChangeLog, TaskValidator, \
+    ProfileValidator, ProfileChangeValidator, BulkOperationValidator
+from tasks.models import TaskManager, PackedTaskManager, SqlTaskManager
+from profiles.models import ProfileManager, SqlProfileManager
+from users.models import UserManager, SqlUserManager
 
 
 redis = Redis()
 
+cache = Cache(db=redis)
+
+metrics = Metrics(cache=cache)
+
+sql = SQLAlchemy()
+
 index_manager = IndexManager(db=redis)
 
-task_manager = TaskManager(db=redis, index=index_manager)
+search_index = SearchIndex(db=redis)
+
+change_log = ChangeLog(db=redis)
+
+
+class StorageBackend():
+    """
+    Forwards to the manager of the storage picked from the app config by
+    init_app, so STORAGE and TASK_STORAGE can be set by a config class.
+    """
+    def __init__(self, choose, **managers):
+        self.choose = choose
+        self.managers = managers
+        self.manager = None
+
+    def init_app(self, app):
+        self.manager = self.managers[self.choose(app.config)]
+        self.manager.init_app(app)
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
 
-profile_manager = ProfileManager(db=redis)
+def choose_task_storage(config):
+    if config['STORAGE'] == 'sqlite':
+        return 'sqlite'
+    return 'packed' if config['TASK_STORAGE'] == 'packed' else 'redis'
+
+
+task_manager = StorageBackend(choose_task_storage,
+    redis=TaskManager(db=redis, index=index_manager, cache=cache,
+        search=search_index, change_log=change_log),
+    packed=PackedTaskManager(db=redis, index=index_manager, cache=cache,
+        search=search_index, change_log=change_log),
+    sqlite=SqlTaskManager(db=sql))
+
+profile_manager = StorageBackend(lambda config: config['STORAGE'],
+    redis=ProfileManager(db=redis, cache=cache),
+    sqlite=SqlProfileManager(db=sql))
 
 profile_validator = ProfileValidator()
 
+profile_change_validator = ProfileChangeValidator()
+
 task_validator = TaskValidator()
 
+bulk_operation_validator = BulkOperationValidator()
+
+credential_cache = Cache(db=redis, config_prefix='AUTH_CACHE')
+
+user_manager = StorageBackend(lambda config: config['STORAGE'],
+    redis=UserManager(db=redis, cache=credential_cache),
+    sqlite=SqlUserManager(db=sql, cache=credential_cache))
+
+rate_limiter = RateLimiter(db=redis)
+
 auth = HTTPBasicAuth()
 
 
 @auth.error_handler
 def unauthorised():
-    return make_response(jsonify({'error': 'Not authorised'}), 403)
+    return make_response(json_response({'error': 'Not authorised'}), 403)
 
 
-@auth.get_password
-def get_password(username):
-    if username == os.environ.get('USERNAME'):
-        return os.environ.get('PASSWORD')
-    return None
+@auth.verify_password
+def verify_password(username, password):
+    """Accepts a bearer token or, failing that, a username and password."""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        g.user = user_manager.verify_token(header[len('Bearer '):])
+    elif user_manager.verify(username, password):
+        g.user = username
+    else:
+        g.user = None
+    return g.user is not None
@@ -15,3 +15,19 @@ class DoesNotExist(ApiError):
 
 class ValidationError(ApiError):
     status_code = 400
+
+
+class ListFull(ApiError):
+    status_code = 409
+
+
+class NotSupported(ApiError):
+    status_code = 501
+
+
+class RateLimited(ApiError):
+    status_code = 429
+
+    def __init__(self, message, retry_after):
+        super(RateLimited, self).__init__(message)
+        self.retry_after = retry_after
@@ -7,8 +7,29 @@ def create_app():
     import os
     app.config.from_object(os.environ['APP_SETTINGS'])
 
-    from .core import redis
+    from .core import redis, cache, metrics, change_log, sql, \
+        credential_cache, user_manager, auth, rate_limiter, index_manager, \
+        task_manager, profile_manager
+    from .connections import init_redis
     redis.init_app(app)
+    init_redis(app, redis)
+    metrics.init_app(app, db=redis, login_required=auth.login_required)
+    cache.init_app(app)
+    index_manager.init_app(app)
+    change_log.init_app(app)
+    credential_cache.init_app(app)
+    user_manager.init_app(app)
+    rate_limiter.init_app(app)
+    task_manager.init_app(app)
+    profile_manager.init_app(app)
+
+    if app.config['STORAGE'] == 'sqlite':
+        from .sql import metadata
+        sql.init_app(app)
+        # Bound so migrations and benchmarks can use the managers outside
+        # a request.
+        sql.app = app
+        metadata.create_all(sql.engine)
 
     from tasks.views import TasksView
     TasksView.register(app)
@@ -16,17 +37,60 @@ def create_app():
     from profiles.views import ProfilesView
     ProfilesView.register(app)
 
-    from .handlers import not_found, bad_request, internal_error
-    from .exceptions import DoesNotExist, ValidationError
+    from .views import StatsView
+    StatsView.register(app)
+
+    from users.views import TokensView
+    TokensView.register(app)
+
+    from .handlers import not_found, bad_request, too_many_requests, \
+        internal_error
+    from .exceptions import DoesNotExist, ValidationError, ListFull, \
+        NotSupported, RateLimited
     app.register_error_handler(DoesNotExist, not_found)
     app.register_error_handler(ValidationError, bad_request)
+    app.register_error_handler(ListFull, bad_request)
+    app.register_error_handler(NotSupported, bad_request)
+    app.register_error_handler(RateLimited, too_many_requests)
     app.register_error_handler(500, internal_error)
 
+    from .responses import compress
+
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
-        return response
+        response.headers.add('Access-Control-Expose-Headers', 'X-Next-Cursor, ETag, Retry-After')
+        return compress(response)
+
+    return app
+
+
+def create_gevent_app():
+    """
+    Builds the app for gevent workers. Each request runs in its own
+    greenlet and yields while it waits on Redis, so one worker can serve
+    many concurrent clients. The greenlets share a bounded pool of Redis
+    connections and wait for a free one rather than opening more.
+    """
+    app = create_app()
+
+    from redis import ConnectionPool, BlockingConnectionPool
+    from .core import redis
+    replica = getattr(redis.connection, 'replica', None)
+    for client in (redis.connection, replica):
+        if client is None:
+            continue
+        pool = client.connection_pool
+        # Sentinel and cluster clients keep their own pools.
+        if type(pool) is not ConnectionPool:
+            continue
+        client.connection_pool = BlockingConnectionPool(
+            max_connections=app.config['REDIS_MAX_CONNECTIONS'],
+            timeout=app.config['REDIS_POOL_TIMEOUT'],
+            connection_class=pool.connection_class,
+            **pool.connection_kwargs
+        )
 
     return app
@@ -1,17 +1,31 @@
-from flask import make_response, jsonify
+from flask import make_response
+from .responses import json_response
 
 
 def not_found(error):
-    response = jsonify(error.to_dict())
+    response = json_response(error.to_dict())
     response.status_code = error.status_code
     return response
 
 
 def bad_request(error):
-    response = jsonify(error.to_dict())
+    response = json_response(error.to_dict())
     response.status_code = error.status_code
     return response
 
 
+def too_many_requests(error):
+    response = json_response(error.to_dict())
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 def internal_error(error):
-    return make_response(jsonify({"error": "Internal server error"}))
+    return make_response(json_response({"error": "Internal server error"}))
+
+
+def not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from flask import request, Response
+from redis.connection import Connection
+
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_local = threading.local()
+
+
+class RequestStats():
+    def __init__(self):
+        self.started = time.time()
+        self.commands = 0
+        self.round_trips = 0
+        self.redis_time = 0.0
+
+
+class InstrumentedConnection(Connection):
+    """
+    Charges the commands, round trips and time spent waiting on Redis to
+    the current request, when that request is being sampled.
+    """
+    def pack_command(self, *args):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.commands += 1
+        return super(InstrumentedConnection, self).pack_command(*args)
+
+    def send_packed_command(self, command):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return super(InstrumentedConnection, self).send_packed_command(
+                command)
+        stats.round_trips += 1
+        started = time.time()
+        try:
+            return super(InstrumentedConnection, self).send_packed_command(
+                command)
+        finally:
+            stats.redis_time += time.time() - started
+
+    def read_response(self):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return super(InstrumentedConnection, self).read_response()
+        started = time.time()
+        try:
+            return super(InstrumentedConnection, self).read_response()
+        finally:
+            stats.redis_time += time.time() - started
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics():
+    def __init__(self):
+        self.request_duration = Histogram()
+        self.redis_duration = Histogram()
+        self.commands = 0
+        self.round_trips = 0
+
+
+class Metrics():
+    """
+    Samples a fraction of requests, reports their Redis usage in a
+    Server-Timing header and aggregates it per route for /metrics.
+    Each worker process keeps its own figures.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.sample_rate = 0.0
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app, db, login_required=None):
+        """
+        Wraps the /metrics view in `login_required`, when given, so only
+        authenticated scrapers can read it.
+        """
+        self.sample_rate = app.config.get('METRICS_SAMPLE_RATE', 0.0)
+        pool = db.connection.connection_pool
+        # Connection classes that already extend InstrumentedConnection, or
+        # that a cluster client depends on, are left alone.
+        if pool.connection_class is Connection:
+            pool.connection_class = InstrumentedConnection
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        view = self._render
+        if login_required is not None:
+            view = login_required(view)
+        app.add_url_rule('/metrics', 'metrics', view)
+
+    def _start(self):
+        _local.stats = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            _local.stats = RequestStats()
+
+    def _finish(self, response):
+        stats = getattr(_local, 'stats', None)
+        _local.stats = None
+        if stats is None or request.url_rule is None:
+            return response
+        response.headers['Server-Timing'] = \
+            'redis;dur=%.2f;desc="%d commands, %d round trips"' % (
+                stats.redis_time * 1000, stats.commands, stats.round_trips)
+        key = (request.method, request.url_rule.rule)
+        with self.lock:
+            route = self.routes.setdefault(key, RouteMetrics())
+            route.request_duration.observe(time.time() - stats.started)
+            route.redis_duration.observe(stats.redis_time)
+            route.commands += stats.commands
+            route.round_trips += stats.round_trips
+        return response
+
+    def _render(self):
+        lines = []
+        with self.lock:
+            routes = sorted(self.routes.items())
+            self._histogram(lines, 'checklist_request_duration_seconds',
+                'Time spent handling sampled requests.',
+                [(key, route.request_duration) for key, route in routes])
+            self._histogram(lines, 'checklist_redis_duration_seconds',
+                'Time sampled requests spent waiting on Redis.',
+                [(key, route.redis_duration) for key, route in routes])
+            self._counter(lines, 'checklist_redis_commands_total',
+                'Redis commands sent by sampled requests.',
+                [(key, route.commands) for key, route in routes])
+            self._counter(lines, 'checklist_redis_round_trips_total',
+                'Redis round trips made by sampled requests.',
+                [(key, route.round_trips) for key, route in routes])
+        if self.cache is not None:
+            stats = self.cache.stats()
+            for name in ('hits', 'misses', 'evictions'):
+                self._counter(lines, 'checklist_cache_%s_total' % name,
+                    'Read cache %s.' % name, [(None, stats[name])])
+        return Response('\n'.join(lines) + '\n',
+            mimetype='text/plain; version=0.0.4')
+
+    def _histogram(self, lines, name, description, values):
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for key, histogram in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, bound, cumulative))
+            lines.append('%s_sum{%s} %f' % (name, labels, histogram.sum))
+            lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+
+    def _counter(self, lines, name, description, values):
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for key, value in values:
+            if key is None:
+                lines.append('%s %d' % (name, value))
+            else:
+                lines.append('%s{%s} %d' % (name, self._labels(key), value))
+
+    def _labels(self, key):
+        method, rule = key
+        return 'method="%s",route="%s"' % (method, rule)
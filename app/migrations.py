@@ -0,0 +1,110 @@
+"""
+Moves existing data onto the current key layout. Every migration is safe
+to run more than once.
+
+    python -m app.migrations
+
+To move tasks into the packed layout used when TASK_STORAGE=packed, stop
+writes and run:
+
+    python -m app.migrations pack-tasks
+
+To rebuild the search index from the stored tasks, run:
+
+    python -m app.migrations rebuild-search
+"""
+import sys
+from .models import IndexManager
+from .tasks.models import TaskManager, PackedTaskManager
+
+
+def migrate_indexes(db):
+    """Converts the unordered `<list>:ids` sets into `<list>:index`."""
+    index_manager = IndexManager(db=db)
+    migrated = 0
+    for key in db.scan_iter(match='*:ids'):
+        index_manager.migrate(key[:-len(':ids')])
+        migrated += 1
+    return migrated
+
+
+def list_names(db):
+    """Yields the name of every list, skipping search index keys."""
+    for key in db.scan_iter(match='*:index'):
+        list_name = key[:-len(':index')]
+        if list_name.startswith('{') and list_name.endswith('}'):
+            list_name = list_name[1:-1]
+        if list_name != '_search' and not list_name.endswith(':_search'):
+            yield list_name
+
+
+def index_done(db, task_manager, batch_size=500):
+    """Builds the `<list>:done` and `<list>:undone` indexes of each list."""
+    index_manager = task_manager.index
+    indexed = 0
+    for list_name in list_names(db):
+        pipe = db.pipeline()
+        for done in (True, False):
+            pipe.delete(index_manager.parse_id(list_name, done))
+        for id_number, task in task_manager.iterate(list_name, batch_size):
+            pipe.zadd(index_manager.parse_id(list_name, task['done']),
+                int(id_number), id_number)
+            indexed += 1
+        pipe.execute()
+    return indexed
+
+
+def pack_tasks(db, batch_size=500):
+    """Moves tasks from one hash per task into PackedTaskManager buckets."""
+    index_manager = IndexManager(db=db)
+    task_manager = TaskManager(db=db, index=index_manager)
+    packed_manager = PackedTaskManager(db=db, index=index_manager)
+    migrated = 0
+    for list_name in list_names(db):
+        id_numbers = index_manager.get(list_name)
+        for start in range(0, len(id_numbers), batch_size):
+            batch = id_numbers[start:start + batch_size]
+            pipe = db.pipeline()
+            for id_number, task in task_manager._get_ordered(list_name, batch):
+                if not task:
+                    continue
+                bucket = packed_manager._bucket(id_number)
+                pipe.hset(packed_manager._parse_bucket_id(list_name, bucket),
+                    id_number, packed_manager.pack(task))
+                pipe.delete(task_manager._parse_id(list_name, id_number))
+                migrated += 1
+            pipe.execute()
+    return migrated
+
+
+def rebuild_search(db, task_manager, batch_size=500):
+    """Clears the search index and indexes every stored task again."""
+    search_index = task_manager.search_index
+    search_index.clear()
+    indexed = 0
+    for list_name in list(list_names(db)):
+        batch = []
+        for id_number, task in task_manager.iterate(list_name, batch_size):
+            batch.append((id_number, task['name']))
+            if len(batch) == batch_size:
+                search_index.add(list_name, batch)
+                indexed += len(batch)
+                batch = []
+        search_index.add(list_name, batch)
+        indexed += len(batch)
+    return indexed
+
+
+if __name__ == '__main__':
+    from .factory import create_app
+    from .core import redis, task_manager
+    app = create_app()
+    if app.config['STORAGE'] != 'redis':
+        sys.exit('Migrations only apply to Redis storage.')
+    if sys.argv[1:] == ['pack-tasks']:
+        print 'Packed %d tasks' % pack_tasks(redis)
+    elif sys.argv[1:] == ['rebuild-search']:
+        print 'Indexed %d tasks' % rebuild_search(redis, task_manager)
+    else:
+        print 'Migrated %d list indexes' % migrate_indexes(redis)
+        print 'Indexed %d tasks by done' % index_done(redis, task_manager)
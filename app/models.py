@@ -1,52 +1,415 @@
+import json
+import re
+import threading
+import unicodedata
+from Queue import Queue, Empty
+from uuid import uuid4
+from redis.client import Script
+from redis.exceptions import ConnectionError
+from .connections import subscribe_forever
 from .exceptions import ValidationError
 
 
+MIGRATE_INDEX = Script(None, """
+local ids = redis.call('SMEMBERS', KEYS[1])
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[2], tonumber(id), id)
+end
+redis.call('DEL', KEYS[1])
+return #ids
+""")
+
+
+def list_prefix(list_name, hash_tags=False):
+    """
+    Returns the prefix of a list's keys. With hash tags, `{<list>}`, every
+    key of a list maps to the same Redis Cluster slot, so the task scripts
+    and transactions can use them together.
+    """
+    return '{%s}' % list_name if hash_tags else list_name
+
+
 class IndexManager():
+    """
+    Keeps the ids of a list in a sorted set scored by id number, so lists
+    can be read in a stable order and paged through by id. Passing `done`
+    reads the index of only done or only undone tasks instead.
+    """
     def __init__(self, db):
         self.db = db
+        self.hash_tags = False
 
-    def get(self, list_name):
-        return self.db.smembers("%s:ids" % list_name)
+    def init_app(self, app):
+        self.hash_tags = app.config.get('REDIS_CLUSTER', False)
+
+    def get(self, list_name, done=None):
+        return self.db.zrange(self.parse_id(list_name, done), 0, -1)
+
+    def page(self, list_name, limit, cursor=None, done=None):
+        lower = '(%s' % cursor if cursor is not None else '-inf'
+        return self.db.zrangebyscore(self.parse_id(list_name, done), lower,
+            '+inf', start=0, num=limit)
 
     def add(self, list_name, id_number):
-        self.db.sadd("%s:ids" % list_name, id_number)
+        self.db.zadd(self.parse_id(list_name), int(id_number), id_number)
 
     def remove(self, list_name, id_number):
-        self.db.srem("%s:ids" % list_name, id_number)
+        self.db.zrem(self.parse_id(list_name), id_number)
+
+    def migrate(self, list_name):
+        """Moves ids from the old unordered `<list>:ids` set into the index."""
+        return MIGRATE_INDEX(
+            keys=["%s:ids" % list_name, self.parse_id(list_name)],
+            client=self.db
+        )
+
+    def parse_id(self, list_name, done=None):
+        prefix = self.parse_list_id(list_name)
+        if done is None:
+            return "%s:index" % prefix
+        return "%s:%s" % (prefix, 'done' if done else 'undone')
+
+    def parse_list_id(self, list_name):
+        return list_prefix(list_name, self.hash_tags)
+
+
+def tokenize(text):
+    """Splits text into lowercase words with accents removed."""
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = u''.join(char for char in text if not unicodedata.combining(char))
+    tokens = []
+    for token in re.findall(r'\w+', text, re.UNICODE):
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+# Shared by the task scripts: replaces the indexed tokens of a task with
+# the space separated `tokens`, or removes the task from the index when
+# `tokens` is nil. The keys are SearchIndex's.
+INDEX_SEARCH = """
+local function index_search(list, id, tokens)
+    local terms = list .. ':_terms'
+    local member = list .. ':' .. id
+    local old = redis.call('HGET', terms, id)
+    if old then
+        for token in string.gmatch(old, '%S+') do
+            redis.call('ZREM', '_search:' .. token, member)
+            redis.call('ZREM', list .. ':_search:' .. token, member)
+        end
+    end
+    if not tokens then
+        redis.call('HDEL', terms, id)
+        return
+    end
+    for token in string.gmatch(tokens, '%S+') do
+        redis.call('ZADD', '_search:' .. token, 1, member)
+        redis.call('ZADD', list .. ':_search:' .. token, 1, member)
+    end
+    redis.call('HSET', terms, id, tokens)
+end
+"""
+
+
+class SearchIndex():
+    """
+    Inverted index from name tokens to tasks. Each token has a sorted set
+    of `<list>:<id>` members per list, `<list>:_search:<token>`, and one
+    across all lists, `_search:<token>`. `<list>:_terms` remembers the
+    tokens indexed for each task so they can be removed without reading
+    the old name. The task scripts keep the index up to date as part of
+    every write, see INDEX_SEARCH; `add` and `update` are for rebuilding it.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def terms(self, name):
+        """Returns the tokens of a name in the form INDEX_SEARCH takes."""
+        return u' '.join(tokenize(name))
+
+    def add(self, list_name, tasks):
+        """Indexes new tasks from (id_number, name) pairs."""
+        pipe = self.db.pipeline(transaction=False)
+        for id_number, name in tasks:
+            self._queue_add(pipe, list_name, id_number, name)
+        pipe.execute()
+
+    def update(self, list_name, tasks):
+        """
+        Reindexes (id_number, name) pairs, removing the task from the index
+        when name is None.
+        """
+        if not tasks:
+            return
+        old_terms = self.db.hmget(self._parse_terms_id(list_name),
+            [id_number for id_number, _ in tasks])
+        pipe = self.db.pipeline(transaction=False)
+        for (id_number, name), terms in zip(tasks, old_terms):
+            member = self._parse_member(list_name, id_number)
+            for token in (terms or '').decode('utf-8').split():
+                pipe.zrem(self._parse_token_id(token), member)
+                pipe.zrem(self._parse_token_id(token, list_name), member)
+            if name is None:
+                pipe.hdel(self._parse_terms_id(list_name), id_number)
+            else:
+                self._queue_add(pipe, list_name, id_number, name)
+        pipe.execute()
+
+    def search(self, tokens, list_names=None, limit=20, offset=0):
+        """
+        Returns the number of tasks matching any token and a page of
+        (list_name, id_number, score) results, where the score is the
+        number of tokens matched.
+        """
+        if list_names is None:
+            keys = [self._parse_token_id(token) for token in tokens]
+        else:
+            keys = [self._parse_token_id(token, list_name)
+                for list_name in list_names for token in tokens]
+        if not keys:
+            return 0, []
+        results = "_search:query:%s" % uuid4().hex
+        pipe = self.db.pipeline(transaction=False)
+        pipe.zunionstore(results, keys)
+        pipe.zrevrange(results, offset, offset + limit - 1, withscores=True)
+        pipe.delete(results)
+        total, matches, _ = pipe.execute()
+        return total, [tuple(member.rsplit(':', 1)) + (int(score),)
+            for member, score in matches]
+
+    def remove_list(self, list_name):
+        """Removes every task of a list from the index."""
+        self.update(list_name, [(id_number, None) for id_number in
+            self.db.hkeys(self._parse_terms_id(list_name))])
+
+    def clear(self):
+        """Deletes the whole index, ready for a rebuild."""
+        for pattern in ('_search:*', '*:_search:*', '*:_terms'):
+            for key in self.db.scan_iter(match=pattern):
+                self.db.delete(key)
+
+    def _queue_add(self, pipe, list_name, id_number, name):
+        member = self._parse_member(list_name, id_number)
+        tokens = tokenize(name)
+        for token in tokens:
+            pipe.zadd(self._parse_token_id(token), 1, member)
+            pipe.zadd(self._parse_token_id(token, list_name), 1, member)
+        pipe.hset(self._parse_terms_id(list_name), id_number,
+            u' '.join(tokens))
+
+    def _parse_member(self, list_name, id_number):
+        return "%s:%s" % (list_name, id_number)
+
+    def _parse_token_id(self, token, list_name=None):
+        if list_name is None:
+            return u"_search:%s" % token
+        return u"%s:_search:%s" % (list_name, token)
+
+    def _parse_terms_id(self, list_name):
+        return "%s:_terms" % list_name
+
+
+class ChangeLog():
+    """
+    Keeps the latest changes to each list in a capped sorted set,
+    `<list>:changes`, scored by the list version each change produced, and
+    publishes them on the `<list>:events` channel. The task scripts do both
+    as part of every write.
+
+    Streams opened by `listen` share one subscription per process, to every
+    list's channel, whose messages a background thread hands out to the
+    streams of their list. Each open stream then costs a queue rather than
+    a Redis connection.
+    """
+    pattern = '*:events'
+    poll_interval = 0.05
+    subscribe_timeout = 5
+    # Put on every stream when the subscription drops, since changes may
+    # have been missed; clients reconnect and catch up from the log.
+    closed = object()
+
+    def __init__(self, db):
+        self.db = db
+        self.size = 1000
+        self.hash_tags = False
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.subscribed = threading.Event()
+        self.subscriber = None
+
+    def init_app(self, app):
+        self.size = app.config.get('CHANGE_LOG_SIZE', 1000)
+        self.hash_tags = app.config.get('REDIS_CLUSTER', False)
+
+    def since(self, list_name, version):
+        """Returns the logged changes after `version`, oldest first."""
+        return [json.loads(change) for change in self.db.zrangebyscore(
+            self.parse_id(list_name), '(%d' % version, '+inf')]
+
+    def listen(self, list_name, timeout):
+        """
+        Starts streaming a list's changes straight away and returns a
+        generator of them, which yields None after `timeout` seconds without
+        one and ends if the subscription drops.
+        """
+        channel = self.parse_channel(list_name)
+        stream = Queue()
+        with self.lock:
+            if self.subscriber is None or not self.subscriber.is_alive():
+                self.subscriber = threading.Thread(target=self._subscribe)
+                self.subscriber.daemon = True
+                self.subscriber.start()
+            self.streams.setdefault(channel, set()).add(stream)
+        # Wait until the subscription is confirmed, so no change published
+        # after this returns is missed.
+        if not self.subscribed.wait(self.subscribe_timeout):
+            self._remove_stream(channel, stream)
+            raise ConnectionError('Not subscribed to change events')
+        return self._messages(channel, stream, timeout)
+
+    def parse_id(self, list_name):
+        return "%s:changes" % list_prefix(list_name, self.hash_tags)
+
+    def parse_channel(self, list_name):
+        return "%s:events" % list_name
+
+    def _messages(self, channel, stream, timeout):
+        try:
+            while True:
+                try:
+                    change = stream.get(timeout=timeout)
+                except Empty:
+                    yield None
+                    continue
+                if change is self.closed:
+                    return
+                yield json.loads(change)
+        finally:
+            self._remove_stream(channel, stream)
+
+    def _remove_stream(self, channel, stream):
+        with self.lock:
+            streams = self.streams.get(channel)
+            if streams is not None:
+                streams.discard(stream)
+                if not streams:
+                    del self.streams[channel]
+
+    def _subscribe(self):
+        subscribe_forever(self.db,
+            lambda pubsub: pubsub.psubscribe(self.pattern),
+            self._handle, self._unsubscribed, self.poll_interval)
+
+    def _handle(self, message):
+        if message['type'] == 'psubscribe':
+            self.subscribed.set()
+        elif message['type'] == 'pmessage':
+            self._dispatch(message['channel'], message['data'])
+
+    def _unsubscribed(self):
+        self.subscribed.clear()
+        self._close_streams()
+
+    def _dispatch(self, channel, change):
+        with self.lock:
+            streams = list(self.streams.get(channel, ()))
+        for stream in streams:
+            stream.put(change)
+
+    def _close_streams(self):
+        with self.lock:
+            streams = [stream for channel_streams in self.streams.values()
+                for stream in channel_streams]
+        for stream in streams:
+            stream.put(self.closed)
 
 
 class Validator():
-    def __init__(self):
-        self.model = {}
+    """
+    Checks request bodies against a model of field names and types. Each
+    set of required fields is compiled once into a checker that makes a
+    single pass over the model.
+    """
+    def __init__(self, model=None):
+        self.model = model if model is not None else {}
+        self.checkers = {(): self._compile(())}
 
     def validate(self, obj, required_fields=[]):
-        for field_name, field_type in self.model.iteritems():
-            try:
-                self._validate_type(obj[field_name], field_name, field_type)
-            except KeyError:
-                self._validate_required_fields(field_name, required_fields)
-
-    def _validate_type(self, field, field_name, field_type):
-        if not isinstance(field, field_type):
-            raise ValidationError('%s field is not of type %s' %
-                (field_name, field_type.__name__)
-            )
+        key = tuple(required_fields)
+        checker = self.checkers.get(key)
+        if checker is None:
+            checker = self.checkers[key] = self._compile(key)
+        checker(obj)
+
+    def _compile(self, required_fields):
+        fields = [(field_name, field_type, field_name in required_fields,
+                '%s field is not of type %s' % (field_name,
+                    field_type.__name__),
+                '%s field is required' % field_name)
+            for field_name, field_type in sorted(self.model.items())]
+
+        def check(obj):
+            for field_name, field_type, required, type_error, missing \
+                    in fields:
+                if field_name in obj:
+                    if not isinstance(obj[field_name], field_type):
+                        raise ValidationError(type_error)
+                elif required:
+                    raise ValidationError(missing)
 
-    def _validate_required_fields(self, field_name, required_fields):
-        if field_name in required_fields:
-            raise ValidationError('%s field is required' % field_name)
+        return check
 
 
 class TaskValidator(Validator):
     def __init__(self):
-        self.model = {
+        Validator.__init__(self, {
             'name': unicode,
             'done': bool,
-        }
+        })
 
 
 class ProfileValidator(Validator):
     def __init__(self):
-        self.model = {
+        Validator.__init__(self, {
             'lists': list
-        }
+        })
+
+
+class ProfileChangeValidator(Validator):
+    def __init__(self):
+        Validator.__init__(self, {
+            'add': list,
+            'remove': list,
+        })
+
+
+class BulkOperationValidator(Validator):
+    operations = {
+        'create': ['task'],
+        'update': ['id', 'task'],
+        'delete': ['id'],
+    }
+
+    def __init__(self):
+        Validator.__init__(self, {
+            'op': unicode,
+            'id': int,
+            'task': dict,
+        })
+        self.op_checkers = dict((op, self._compile(['op'] + fields))
+            for op, fields in self.operations.items())
+
+    def validate(self, obj, required_fields=[]):
+        if not isinstance(obj, dict):
+            raise ValidationError('operation is not of type dict')
+        op = obj.get('op')
+        checker = self.op_checkers.get(op) if isinstance(op, unicode) \
+            else None
+        if checker is None:
+            Validator.validate(self, obj, required_fields=['op'])
+            raise ValidationError('op field must be one of %s' %
+                ', '.join(sorted(self.operations))
+            )
+        checker(obj)
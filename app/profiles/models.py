@@ -1,19 +1,137 @@
-class ProfileManager():
-    def __init__(self, db):
+import json
+from redis.client import Script
+from sqlalchemy import select, func, and_
+from ..cache import Cache
+from ..exceptions import DoesNotExist
+from ..models import list_prefix
+from ..sql import profiles, profile_lists
+
+
+# Swaps in a new set of lists in one step, so readers never see the
+# profile missing. Returns nil if the profile does not exist.
+# KEYS: profile, version. ARGV: list names.
+REPLACE_PROFILE = Script(None, """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+redis.call('DEL', KEYS[1])
+for i = 1, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('INCR', KEYS[2])
+return redis.call('LRANGE', KEYS[1], 0, -1)
+""")
+
+# Removes and appends individual list names without rewriting the profile.
+# Names that are already present are not added twice. Returns nil if the
+# profile does not exist.
+# KEYS: profile, version. ARGV: number of names to remove, names to remove,
+# names to add.
+UPDATE_PROFILE_LISTS = Script(None, """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local removed = tonumber(ARGV[1])
+for i = 2, removed + 1 do
+    redis.call('LREM', KEYS[1], 0, ARGV[i])
+end
+local present = {}
+for _, name in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    present[name] = true
+end
+for i = removed + 2, #ARGV do
+    if not present[ARGV[i]] then
+        redis.call('RPUSH', KEYS[1], ARGV[i])
+        present[ARGV[i]] = true
+    end
+end
+redis.call('INCR', KEYS[2])
+return redis.call('LRANGE', KEYS[1], 0, -1)
+""")
+
+
+class BaseProfileManager():
+    """
+    The profile storage interface the views use, implemented on Redis by
+    ProfileManager and on SQL by SqlProfileManager.
+    """
+    def init_app(self, app):
+        pass
+
+    def create(self, profile_name, request_json):
+        raise NotImplementedError
+
+    def get(self, profile_name, version=None):
+        """
+        Returns the profile's lists. Passing the version the caller just
+        read keeps a cached copy from an earlier version from being used.
+        """
+        raise NotImplementedError
+
+    def delete(self, profile_name):
+        raise NotImplementedError
+
+    def version(self, profile_name):
+        raise NotImplementedError
+
+    def exists(self, profile_name):
+        raise NotImplementedError
+
+    def update(self, profile_name, request_json):
+        raise NotImplementedError
+
+    def update_lists(self, profile_name, request_json):
+        raise NotImplementedError
+
+    def _does_not_exist(self, profile_name):
+        return DoesNotExist("Profile '%s' does not exist." % profile_name)
+
+
+class ProfileManager(BaseProfileManager):
+    """
+    Stores each profile as a Redis list of list names, `profile:<name>`.
+    Every write publishes a change on `profile:<name>:events`. In cluster
+    mode the name is hash tagged, `profile:{<name>}`, so the scripts can
+    use a profile's keys together.
+    """
+    def __init__(self, db, cache=None):
         self.db = db
+        self.cache = cache if cache is not None else Cache(db=db)
+        self.hash_tags = False
+
+    def init_app(self, app):
+        self.hash_tags = app.config.get('REDIS_CLUSTER', False)
 
     def create(self, profile_name, request_json):
         profile_list = request_json.get('lists')
         profile = self._parse_id(profile_name)
-        self.db.lpush(profile, *reversed(profile_list))
+        pipe = self.db.pipeline(transaction=False)
+        pipe.lpush(profile, *reversed(profile_list))
+        pipe.incr(self._parse_version_id(profile_name))
+        self._publish(pipe, profile_name, 'create', profile_list)
+        pipe.execute()
+        self.cache.invalidate(profile)
 
-    def get(self, profile_name):
+    def get(self, profile_name, version=None):
         profile = self._parse_id(profile_name)
-        return self.db.lrange(profile, 0, -1)
+        profile_lists = self.cache.get(profile, 'lists', version)
+        if profile_lists is None:
+            profile_lists = self.db.lrange(profile, 0, -1)
+            self.cache.set(profile, 'lists', profile_lists, version)
+        return profile_lists
 
     def delete(self, profile_name):
         profile = self._parse_id(profile_name)
-        self.db.delete(profile)
+        pipe = self.db.pipeline(transaction=False)
+        pipe.delete(profile)
+        pipe.incr(self._parse_version_id(profile_name))
+        self._publish(pipe, profile_name, 'delete')
+        pipe.execute()
+        self.cache.invalidate(profile)
+
+    def version(self, profile_name):
+        """Returns a counter that changes on every write to the profile."""
+        return int(self.db.get(self._parse_version_id(profile_name)) or 0)
 
     def exists(self, profile_name):
         profile = self._parse_id(profile_name)
@@ -22,8 +140,142 @@ class ProfileManager():
         return False
 
     def update(self, profile_name, request_json):
-        self.delete(profile_name)
-        self.create(profile_name, request_json)
+        profile_lists = REPLACE_PROFILE(
+            keys=self._script_keys(profile_name),
+            args=request_json.get('lists'),
+            client=self.db
+        )
+        return self._updated(profile_name, profile_lists, 'replace')
+
+    def update_lists(self, profile_name, request_json):
+        """Applies the `add` and `remove` list names in request_json."""
+        remove = request_json.get('remove', [])
+        add = request_json.get('add', [])
+        profile_lists = UPDATE_PROFILE_LISTS(
+            keys=self._script_keys(profile_name),
+            args=[len(remove)] + remove + add,
+            client=self.db
+        )
+        return self._updated(profile_name, profile_lists, 'update')
+
+    def _updated(self, profile_name, profile_lists, op):
+        if profile_lists is None:
+            raise self._does_not_exist(profile_name)
+        self.cache.invalidate(self._parse_id(profile_name))
+        self._publish(self.db, profile_name, op, profile_lists)
+        return profile_lists
+
+    def _publish(self, client, profile_name, op, profile_lists=None):
+        change = {'op': op, 'profile': profile_name}
+        if profile_lists is not None:
+            change['lists'] = profile_lists
+        client.publish(self._parse_channel(profile_name),
+            json.dumps(change, separators=(',', ':')))
+
+    def _script_keys(self, profile_name):
+        return [self._parse_id(profile_name),
+            self._parse_version_id(profile_name)]
 
     def _parse_id(self, profile_name):
-        return "profile:%s" % profile_name
+        return "profile:%s" % list_prefix(profile_name, self.hash_tags)
+
+    def _parse_version_id(self, profile_name):
+        return "%s:version" % self._parse_id(profile_name)
+
+    def _parse_channel(self, profile_name):
+        return "profile:%s:events" % profile_name
+
+
+class SqlProfileManager(BaseProfileManager):
+    """ProfileManager backed by the SQL tables in app/sql.py."""
+    def __init__(self, db):
+        self.db = db
+
+    def create(self, profile_name, request_json):
+        """Puts the new lists in front of any the profile already has."""
+        new_lists = request_json.get('lists')
+        with self.db.engine.begin() as connection:
+            first = connection.execute(
+                select([func.min(profile_lists.c.position)])
+                .where(profile_lists.c.profile == profile_name)).scalar()
+            start = (first if first is not None else 0) - len(new_lists)
+            self._insert(connection, profile_name, new_lists, start)
+            self._bump_version(connection, profile_name)
+
+    def get(self, profile_name, version=None):
+        return self._lists(self.db.engine, profile_name)
+
+    def delete(self, profile_name):
+        with self.db.engine.begin() as connection:
+            connection.execute(profile_lists.delete()
+                .where(profile_lists.c.profile == profile_name))
+            self._bump_version(connection, profile_name)
+
+    def version(self, profile_name):
+        """Returns a counter that changes on every write to the profile."""
+        query = select([profiles.c.version]) \
+            .where(profiles.c.name == profile_name)
+        return self.db.engine.execute(query).scalar() or 0
+
+    def exists(self, profile_name):
+        query = select([profile_lists.c.position]) \
+            .where(profile_lists.c.profile == profile_name).limit(1)
+        return self.db.engine.execute(query).first() is not None
+
+    def update(self, profile_name, request_json):
+        with self.db.engine.begin() as connection:
+            self._check_exists(connection, profile_name)
+            connection.execute(profile_lists.delete()
+                .where(profile_lists.c.profile == profile_name))
+            self._insert(connection, profile_name, request_json.get('lists'))
+            self._bump_version(connection, profile_name)
+            return self._lists(connection, profile_name)
+
+    def update_lists(self, profile_name, request_json):
+        """Applies the `add` and `remove` list names in request_json."""
+        remove = request_json.get('remove', [])
+        add = request_json.get('add', [])
+        with self.db.engine.begin() as connection:
+            self._check_exists(connection, profile_name)
+            if remove:
+                connection.execute(profile_lists.delete().where(and_(
+                    profile_lists.c.profile == profile_name,
+                    profile_lists.c.list_name.in_(remove))))
+            present = self._lists(connection, profile_name)
+            new_lists = []
+            for list_name in add:
+                if list_name not in present and list_name not in new_lists:
+                    new_lists.append(list_name)
+            last = connection.execute(
+                select([func.max(profile_lists.c.position)])
+                .where(profile_lists.c.profile == profile_name)).scalar()
+            start = last + 1 if last is not None else 0
+            self._insert(connection, profile_name, new_lists, start)
+            self._bump_version(connection, profile_name)
+            return present + new_lists
+
+    def _lists(self, connection, profile_name):
+        query = select([profile_lists.c.list_name]) \
+            .where(profile_lists.c.profile == profile_name) \
+            .order_by(profile_lists.c.position)
+        return [row.list_name for row in connection.execute(query)]
+
+    def _check_exists(self, connection, profile_name):
+        query = select([profile_lists.c.position]) \
+            .where(profile_lists.c.profile == profile_name).limit(1)
+        if connection.execute(query).first() is None:
+            raise self._does_not_exist(profile_name)
+
+    def _insert(self, connection, profile_name, list_names, start=0):
+        if list_names:
+            connection.execute(profile_lists.insert(), [
+                {'profile': profile_name, 'position': start + offset,
+                    'list_name': list_name}
+                for offset, list_name in enumerate(list_names)])
+
+    def _bump_version(self, connection, profile_name):
+        result = connection.execute(profiles.update()
+            .where(profiles.c.name == profile_name)
+            .values(version=profiles.c.version + 1))
+        if not result.rowcount:
+            connection.execute(profiles.insert(), name=profile_name, version=1)
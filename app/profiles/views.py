@@ -1,7 +1,10 @@
 from flask.ext.classy import FlaskView, route
-from flask import jsonify, request
-from ..core import auth, profile_manager, profile_validator
-from ..exceptions import DoesNotExist
+from flask import request, current_app
+from ..core import auth, profile_manager, profile_validator, \
+    profile_change_validator, task_manager, rate_limiter
+from ..exceptions import DoesNotExist, ValidationError
+from ..handlers import not_modified
+from ..responses import json_response
 
 
 class ProfilesView(FlaskView):
@@ -10,7 +13,7 @@ class ProfilesView(FlaskView):
 
     @auth.login_required
     def before_request(self, *args, **kwargs):
-        pass
+        rate_limiter.check()
 
     def before_get(self, profile_name):
         if not profile_manager.exists(profile_name):
@@ -18,8 +21,16 @@ class ProfilesView(FlaskView):
 
     @route('/<profile_name>', methods=['GET'])
     def get(self, profile_name):
-        profile_lists = profile_manager.get(profile_name)
-        return jsonify({'lists': profile_lists}), 200
+        if 'expand' in request.args:
+            return self._get_expanded(profile_name)
+        version = profile_manager.version(profile_name)
+        etag = str(version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        profile_lists = profile_manager.get(profile_name, version)
+        response = json_response({'lists': profile_lists})
+        response.set_etag(etag, weak=True)
+        return response, 200
 
     def before_post(self, profile_name):
         profile_validator.validate(request.json, required_fields=['lists'])
@@ -28,18 +39,21 @@ class ProfilesView(FlaskView):
     def post(self, profile_name):
         profile_manager.create(profile_name, request.json)
         lists = profile_manager.get(profile_name)
-        return jsonify({'lists': lists}), 201
+        return json_response({'lists': lists}), 201
 
     def before_patch(self, profile_name):
-        profile_validator.validate(request.json, required_fields=['lists'])
-        if not profile_manager.exists(profile_name):
-            raise DoesNotExist("Profile '%s' does not exist." % profile_name)
+        if self._is_change(request.json):
+            profile_change_validator.validate(request.json)
+        else:
+            profile_validator.validate(request.json, required_fields=['lists'])
 
     @route('/<profile_name>', methods=['PATCH', 'PUT'])
     def patch(self, profile_name):
-        profile_manager.update(profile_name, request.json)
-        lists = profile_manager.get(profile_name)
-        return jsonify({'lists': lists}), 200
+        if self._is_change(request.json):
+            lists = profile_manager.update_lists(profile_name, request.json)
+        else:
+            lists = profile_manager.update(profile_name, request.json)
+        return json_response({'lists': lists}), 200
 
     def before_delete(self, profile_name):
         if not profile_manager.exists(profile_name):
@@ -48,4 +62,16 @@ class ProfilesView(FlaskView):
     @route('/<profile_name>', methods=['DELETE'])
     def delete(self, profile_name):
         profile_manager.delete(profile_name)
-        return jsonify({'success': True}), 204
+        return json_response({'success': True}), 204
+
+    def _is_change(self, request_json):
+        return request.method == 'PATCH' and 'lists' not in request_json \
+            and ('add' in request_json or 'remove' in request_json)
+
+    def _get_expanded(self, profile_name):
+        if request.args['expand'] != 'tasks':
+            raise ValidationError("expand must be 'tasks'")
+        profile_lists = profile_manager.get(profile_name)
+        limit = current_app.config['MAX_EXPANDED_TASKS']
+        tasks = task_manager.expand(profile_lists, limit)
+        return json_response({'lists': profile_lists, 'tasks': tasks}), 200
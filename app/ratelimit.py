@@ -0,0 +1,93 @@
+import math
+import threading
+import time
+from flask import request, g
+from redis.client import Script
+from .exceptions import RateLimited
+
+
+# Refills the bucket for the time elapsed since it was last used and takes
+# a token if one is left. Returns whether a token was taken and, if not,
+# how many seconds until one will be. Time comes from the caller because
+# scripts that write may not call TIME.
+# KEYS: bucket. ARGV: tokens per second, capacity, now.
+TAKE_TOKEN = Script(None, """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+""")
+
+
+class RateLimiter():
+    """
+    Token-bucket rate limiting per authenticated user and route. Buckets
+    live in Redis so limits hold across workers and hosts, and each check
+    is a single script call. Limits are set per endpoint class in
+    RATE_LIMITS as (tokens per second, burst capacity).
+
+    Without Redis storage the buckets are kept in process instead, so each
+    worker enforces the limits on its own.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.enabled = False
+        self.limits = {}
+        self.local = False
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', False)
+        self.limits = app.config.get('RATE_LIMITS', {})
+        self.local = app.config.get('STORAGE', 'redis') != 'redis'
+
+    def check(self, endpoint_class=None):
+        """
+        Takes a token for the current request, raising RateLimited if the
+        bucket is empty. Reads default to the 'read' class and other
+        methods to 'write'.
+        """
+        if not self.enabled:
+            return
+        if endpoint_class is None:
+            endpoint_class = 'read' if request.method in ('GET', 'HEAD') \
+                else 'write'
+        rate, capacity = self.limits[endpoint_class]
+        key = self._parse_id(g.user, request.endpoint)
+        if self.local:
+            wait = self._take_local_token(key, rate, capacity, time.time())
+        else:
+            wait = float(TAKE_TOKEN(keys=[key],
+                args=[rate, capacity, repr(time.time())], client=self.db))
+        if wait > 0:
+            raise RateLimited('Rate limit exceeded',
+                retry_after=int(math.ceil(wait)))
+
+    def _take_local_token(self, key, rate, capacity, now):
+        """TAKE_TOKEN on an in-process bucket."""
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / float(rate)
+            self.buckets[key] = (tokens, now)
+        return wait
+
+    def _parse_id(self, user, endpoint):
+        return 'ratelimit:%s:%s' % (user, endpoint)
@@ -0,0 +1,88 @@
+"""
+Compact JSON responses. Uses ujson when it is installed, which encodes
+large task lists several times faster, and the standard library otherwise.
+Unlike Flask's jsonify, nothing is pretty-printed and the encoded string is
+handed straight to the response.
+
+Clients that prefer application/x-msgpack in Accept get MessagePack instead
+when msgpack is installed, and large bodies are compressed with brotli or
+gzip according to Accept-Encoding.
+"""
+import json
+import zlib
+from flask import current_app, request
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+
+def dumps(obj):
+    if ujson is not None:
+        return ujson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def json_response(obj, status=200):
+    if msgpack is not None and _best_mimetype() == MSGPACK_MIMETYPE:
+        body, mimetype = msgpack.packb(obj), MSGPACK_MIMETYPE
+    else:
+        body, mimetype = dumps(obj), 'application/json'
+    response = current_app.response_class(body, status=status,
+        mimetype=mimetype)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
+
+
+def compress(response):
+    """
+    Compresses the body with the best encoding the client accepts when it
+    is at least COMPRESSION_MIN_SIZE bytes. Streamed responses are sent as
+    they are so that rows and events are not held back by the compressor.
+    """
+    config = current_app.config
+    if not config['COMPRESSION_ENABLED'] or response.is_streamed or \
+            response.direct_passthrough or response.status_code != 200 or \
+            'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < config['COMPRESSION_MIN_SIZE']:
+        return response
+    encoding = request.accept_encodings.best_match(_encodings())
+    if encoding == 'br':
+        data = brotli.compress(data, quality=config['BROTLI_QUALITY'])
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED,
+            16 + zlib.MAX_WBITS)
+        data = compressor.compress(data) + compressor.flush()
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _best_mimetype():
+    return request.accept_mimetypes.best_match(
+        ['application/json', MSGPACK_MIMETYPE])
+
+
+def _encodings():
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
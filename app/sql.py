@@ -0,0 +1,57 @@
+"""
+Tables for running without Redis. SqlTaskManager, SqlProfileManager and
+SqlUserManager expose the same public methods as TaskManager,
+ProfileManager and UserManager, so views and benchmarks work unchanged
+when STORAGE=sqlite selects them in core.py.
+"""
+from sqlalchemy import event, MetaData, Table, Column, Index, Integer, \
+    String, Boolean
+from sqlalchemy.engine import Engine
+
+
+metadata = MetaData()
+
+# The (list_name, id) primary key doubles as the index for list reads.
+tasks = Table('tasks', metadata,
+    Column('list_name', String(255), primary_key=True),
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('name', String, nullable=False),
+    Column('done', Boolean, nullable=False),
+)
+
+# Serves done filters and counts without reading other tasks.
+Index('tasks_done', tasks.c.list_name, tasks.c.done, tasks.c.id)
+
+lists = Table('lists', metadata,
+    Column('list_name', String(255), primary_key=True),
+    Column('counter', Integer, nullable=False),
+    Column('version', Integer, nullable=False),
+)
+
+profiles = Table('profiles', metadata,
+    Column('name', String(255), primary_key=True),
+    Column('version', Integer, nullable=False),
+)
+
+# The (profile, position) primary key keeps a profile's lists in order.
+profile_lists = Table('profile_lists', metadata,
+    Column('profile', String(255), primary_key=True),
+    Column('position', Integer, primary_key=True, autoincrement=False),
+    Column('list_name', String(255), nullable=False),
+)
+
+users = Table('users', metadata,
+    Column('name', String(255), primary_key=True),
+    Column('password', String, nullable=False),
+)
+
+
+@event.listens_for(Engine, 'connect')
+def use_wal(connection, record):
+    """Lets readers carry on while a write is in progress."""
+    if type(connection).__module__.startswith('sqlite3'):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
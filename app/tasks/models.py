@@ -1,47 +1,490 @@
-from ..exceptions import DoesNotExist
+import json
+from redis.client import Script
+from sqlalchemy import select, func, case, and_
+from ..cache import Cache
+from ..exceptions import DoesNotExist, ListFull, NotSupported
+from ..models import SearchIndex, ChangeLog, INDEX_SEARCH, tokenize
+from ..sql import tasks, lists
 
 
-class TaskManager():
-    def __init__(self, db, index):
+# Shared by the task scripts: records a change in the list's capped change
+# log, scored by the version it produced, and publishes it.
+LOG_CHANGE = """
+local function log_change(log, size, channel, change)
+    local message = cjson.encode(change)
+    redis.call('ZADD', log, change.version, message)
+    redis.call('ZREMRANGEBYRANK', log, 0, -tonumber(size) - 1)
+    redis.call('PUBLISH', channel, message)
+end
+"""
+
+# Allocates the next id, stores the task hash and indexes it atomically,
+# in the list index, in the done or undone index and, when the search flag
+# is '1', in the search index. Returns 0 instead when the list already
+# holds the maximum number of tasks, if there is one.
+# KEYS: counter, index, version, done, undone, change log. ARGV: list name,
+# name, done, change log size, channel, maximum list size, key prefix,
+# search flag, name tokens.
+CREATE_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+local max_size = tonumber(ARGV[6])
+if max_size > 0 and redis.call('ZCARD', KEYS[2]) >= max_size then
+    return 0
+end
+local id = redis.call('INCR', KEYS[1])
+redis.call('HMSET', ARGV[7] .. ':' .. id, 'name', ARGV[2], 'done', ARGV[3])
+redis.call('ZADD', KEYS[2], id, id)
+redis.call('ZADD', ARGV[3] == 'True' and KEYS[4] or KEYS[5], id, id)
+if ARGV[8] == '1' then
+    index_search(ARGV[1], id, ARGV[9])
+end
+local version = redis.call('INCR', KEYS[3])
+log_change(KEYS[6], ARGV[4], ARGV[5], {op = 'create', list = ARGV[1],
+    id = id, version = version,
+    fields = {name = ARGV[2], done = ARGV[3] == 'True'}})
+return id
+""")
+
+# Updates the given fields of a task if it exists and returns the result,
+# reindexing its name when the search flag is '1'.
+# KEYS: task, version, done, undone, change log. ARGV: id, list name,
+# change log size, channel, search flag, name tokens, field/value pairs.
+UPDATE_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+if ARGV[5] == '1' then
+    index_search(ARGV[2], ARGV[1], ARGV[6])
+end
+if #ARGV > 6 then
+    redis.call('HMSET', KEYS[1], unpack(ARGV, 7))
+    local version = redis.call('INCR', KEYS[2])
+    local done = redis.call('HGET', KEYS[1], 'done') == 'True'
+    redis.call('ZADD', done and KEYS[3] or KEYS[4], ARGV[1], ARGV[1])
+    redis.call('ZREM', done and KEYS[4] or KEYS[3], ARGV[1])
+    local fields = {}
+    for i = 7, #ARGV, 2 do
+        fields[ARGV[i]] = ARGV[i + 1]
+    end
+    if fields.done then
+        fields.done = fields.done == 'True'
+    end
+    log_change(KEYS[5], ARGV[3], ARGV[4], {op = 'update', list = ARGV[2],
+        id = tonumber(ARGV[1]), version = version, fields = fields})
+end
+return redis.call('HGETALL', KEYS[1])
+""")
+
+# Deletes a task and removes it from the indexes, and from the search index
+# when the search flag is '1', returning 0 if it is missing.
+# KEYS: task, index, version, done, undone, change log. ARGV: id, list name,
+# change log size, channel, search flag.
+DELETE_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('ZREM', KEYS[5], ARGV[1])
+if ARGV[5] == '1' then
+    index_search(ARGV[2], ARGV[1], nil)
+end
+local version = redis.call('INCR', KEYS[3])
+log_change(KEYS[6], ARGV[3], ARGV[4], {op = 'delete', list = ARGV[2],
+    id = tonumber(ARGV[1]), version = version})
+return 1
+""")
+
+# The same operations for PackedTaskManager, where a task is one field of a
+# bucket hash holding a done flag followed by the name.
+# KEYS: counter, index, version, done, undone, change log. ARGV: list name,
+# bucket size, packed task, change log size, channel, maximum list size,
+# key prefix, search flag, name tokens.
+CREATE_PACKED_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+local max_size = tonumber(ARGV[6])
+if max_size > 0 and redis.call('ZCARD', KEYS[2]) >= max_size then
+    return 0
+end
+local id = redis.call('INCR', KEYS[1])
+local bucket = ARGV[7] .. ':tasks:' .. math.floor(id / tonumber(ARGV[2]))
+local done = string.sub(ARGV[3], 1, 1) == '1'
+redis.call('HSET', bucket, id, ARGV[3])
+redis.call('ZADD', KEYS[2], id, id)
+redis.call('ZADD', done and KEYS[4] or KEYS[5], id, id)
+if ARGV[8] == '1' then
+    index_search(ARGV[1], id, ARGV[9])
+end
+local version = redis.call('INCR', KEYS[3])
+log_change(KEYS[6], ARGV[4], ARGV[5], {op = 'create', list = ARGV[1],
+    id = id, version = version,
+    fields = {name = string.sub(ARGV[3], 2), done = done}})
+return id
+""")
+
+# KEYS: bucket, version, done, undone, change log. ARGV: id, list name,
+# change log size, channel, search flag, name tokens, done flag or '', name
+# or nothing.
+UPDATE_PACKED_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+local task = redis.call('HGET', KEYS[1], ARGV[1])
+if not task then
+    return nil
+end
+if ARGV[5] == '1' then
+    index_search(ARGV[2], ARGV[1], ARGV[6])
+end
+local done = ARGV[7] ~= '' and ARGV[7] or string.sub(task, 1, 1)
+local name = ARGV[8] or string.sub(task, 2)
+local updated = done .. name
+if updated ~= task then
+    redis.call('HSET', KEYS[1], ARGV[1], updated)
+    local version = redis.call('INCR', KEYS[2])
+    redis.call('ZADD', done == '1' and KEYS[3] or KEYS[4], ARGV[1], ARGV[1])
+    redis.call('ZREM', done == '1' and KEYS[4] or KEYS[3], ARGV[1])
+    local fields = {name = ARGV[8]}
+    if ARGV[7] ~= '' then
+        fields.done = ARGV[7] == '1'
+    end
+    log_change(KEYS[5], ARGV[3], ARGV[4], {op = 'update', list = ARGV[2],
+        id = tonumber(ARGV[1]), version = version, fields = fields})
+end
+return updated
+""")
+
+# KEYS: bucket, index, version, done, undone, change log. ARGV: id, list
+# name, change log size, channel, search flag.
+DELETE_PACKED_TASK = Script(None, INDEX_SEARCH + LOG_CHANGE + """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('ZREM', KEYS[5], ARGV[1])
+if ARGV[5] == '1' then
+    index_search(ARGV[2], ARGV[1], nil)
+end
+local version = redis.call('INCR', KEYS[3])
+log_change(KEYS[6], ARGV[3], ARGV[4], {op = 'delete', list = ARGV[2],
+    id = tonumber(ARGV[1]), version = version})
+return 1
+""")
+
+
+class BaseTaskManager():
+    """
+    The task storage interface the views use, implemented on Redis by
+    TaskManager and PackedTaskManager and on SQL by SqlTaskManager.
+    """
+    max_list_size = 0
+
+    def init_app(self, app):
+        self.max_list_size = app.config.get('MAX_LIST_SIZE', 0)
+
+    def all(self, list_name, done=None, version=None):
+        """
+        Returns every task in the list. Passing the version the caller just
+        read keeps a cached copy from an earlier version from being used.
+        """
+        raise NotImplementedError
+
+    def page(self, list_name, limit, cursor=None, done=None):
+        raise NotImplementedError
+
+    def head(self, list_name, limit, done=None):
+        raise NotImplementedError
+
+    def expand(self, list_names, limit):
+        raise NotImplementedError
+
+    def iterate(self, list_name, batch_size, done=None):
+        raise NotImplementedError
+
+    def create(self, list_name, request_json):
+        raise NotImplementedError
+
+    def bulk(self, list_name, operations):
+        raise NotImplementedError
+
+    def get(self, list_name, id_number, version=None):
+        raise NotImplementedError
+
+    def update(self, list_name, id_number, new_data):
+        raise NotImplementedError
+
+    def delete(self, list_name, id_number):
+        raise NotImplementedError
+
+    def version(self, list_name):
+        raise NotImplementedError
+
+    def search(self, query, list_names=None, limit=20, offset=0):
+        raise NotImplementedError
+
+    def changes(self, list_name, since):
+        raise NotImplementedError
+
+    def listen(self, list_name, timeout):
+        raise NotImplementedError
+
+    def delta(self, list_name, since):
+        raise NotImplementedError
+
+    def count(self, list_name):
+        raise NotImplementedError
+
+    def exists(self, list_name, id_number):
+        raise NotImplementedError
+
+    def _does_not_exist(self, id_number):
+        return DoesNotExist("Task with id %s does not exist." % id_number)
+
+    def _list_full(self, list_name):
+        return ListFull("List '%s' already holds the maximum of %s tasks." %
+            (list_name, self.max_list_size))
+
+    def _parse_new_task(self, new_data):
+        task = dict()
+        task['name'] = new_data['name']
+        task['done'] = new_data.get('done', False)
+        return task
+
+
+class TaskManager(BaseTaskManager):
+    """
+    Stores each task as its own hash, `<list>:<id>`, next to the list's
+    index, counter and version keys. The `<list>:done` and `<list>:undone`
+    sorted sets index tasks by done state for filtered reads and counts.
+    The write scripts also index names for SearchIndex and record every
+    change for ChangeLog.
+    """
+    create_script = CREATE_TASK
+    update_script = UPDATE_TASK
+    delete_script = DELETE_TASK
+
+    def __init__(self, db, index, cache=None, search=None, change_log=None):
         self.db = db
         self.index = index
+        self.cache = cache if cache is not None else Cache(db=db)
+        self.search_index = search if search is not None \
+            else SearchIndex(db=db)
+        self.change_log = change_log if change_log is not None \
+            else ChangeLog(db=db)
+
+    def all(self, list_name, done=None, version=None):
+        scope = self._parse_scope(list_name)
+        key = 'all' if done is None else 'all:%s' % done
+        objects = self.cache.get(scope, key, version)
+        if objects is None:
+            id_numbers = self.index.get(list_name, done)
+            objects = self._get_many(list_name, id_numbers)
+            self.cache.set(scope, key, objects, version)
+        return objects
+
+    def page(self, list_name, limit, cursor=None, done=None):
+        id_numbers = self.index.page(list_name, limit + 1, cursor, done)
+        next_cursor = None
+        if len(id_numbers) > limit:
+            id_numbers = id_numbers[:limit]
+            next_cursor = id_numbers[-1]
+        return self._get_many(list_name, id_numbers), next_cursor
 
-    def all(self, list_name):
+    def head(self, list_name, limit, done=None):
+        """
+        Returns the first `limit` tasks and how many tasks the list holds,
+        in two round trips however long the list is.
+        """
+        key = self.index.parse_id(list_name, done)
+        pipe = self.db.pipeline(transaction=False)
+        pipe.zrange(key, 0, limit - 1)
+        pipe.zcard(key)
+        id_numbers, total = pipe.execute()
+        return self._get_many(list_name, id_numbers), total
+
+    def expand(self, list_names, limit):
+        """
+        Returns up to `limit` tasks of each list, keyed by list name, in two
+        round trips however many lists there are.
+        """
+        pipe = self.db.pipeline(transaction=False)
+        for list_name in list_names:
+            pipe.zrange(self.index.parse_id(list_name), 0, limit - 1)
+        id_numbers = pipe.execute()
+        counts = [self._queue_reads(pipe, list_name, list_ids)
+            for list_name, list_ids in zip(list_names, id_numbers)]
+        replies = pipe.execute()
         objects = {}
-        for id_number in self.index.get(list_name):
-            task = self.get(list_name, id_number)
-            objects[id_number] = task
+        for list_name, list_ids, count in zip(list_names, id_numbers, counts):
+            tasks = self._parse_reads(list_ids, replies[:count])
+            replies = replies[count:]
+            objects[list_name] = dict(zip(list_ids, tasks))
         return objects
 
+    def iterate(self, list_name, batch_size, done=None):
+        """
+        Yields (id_number, task) pairs in id order, reading `batch_size`
+        tasks per round trip so memory use does not grow with the list.
+        """
+        cursor = None
+        while True:
+            id_numbers = self.index.page(list_name, batch_size, cursor, done)
+            for id_number, task in self._get_ordered(list_name, id_numbers):
+                if task:
+                    yield id_number, task
+            if len(id_numbers) < batch_size:
+                return
+            cursor = id_numbers[-1]
+
     def create(self, list_name, request_json):
-        id_number = self._get_id_number(list_name)
-        task_id = self._parse_id(list_name, id_number)
         task = self._parse_new_task(request_json)
-        self.db.hmset(task_id, task)
-        self.index.add(list_name, id_number)
-        return id_number
+        id_number = self.create_script(
+            keys=self._create_keys(list_name),
+            args=self._create_args(list_name, task),
+            client=self.db
+        )
+        if not id_number:
+            raise self._list_full(list_name)
+        self.cache.invalidate(self._parse_scope(list_name))
+        return str(id_number), task
+
+    def bulk(self, list_name, operations):
+        """
+        Runs a batch of (op, id_number, data) operations in one transaction.
+        Returns an (id_number, task) pair for each operation, or a
+        DoesNotExist error when an update or delete targets a missing task.
+        Redis Cluster pipelines cannot run scripts, so in cluster mode each
+        operation is run, atomically, on its own instead.
+        """
+        if self.index.hash_tags:
+            replies = [self._run_operation(self.db, list_name, *operation)
+                for operation in operations]
+        else:
+            pipe = self.db.pipeline()
+            for operation in operations:
+                self._run_operation(pipe, list_name, *operation)
+            replies = pipe.execute()
+        self.cache.invalidate(self._parse_scope(list_name))
+        results = []
+        for (op, id_number, data), reply in zip(operations, replies):
+            if op == 'create' and not reply:
+                results.append(self._list_full(list_name))
+            elif op == 'create':
+                results.append((str(reply), self._parse_new_task(data)))
+            elif not reply:
+                results.append(self._does_not_exist(id_number))
+            elif op == 'update':
+                results.append((id_number, self._parse_update_reply(reply)))
+            else:
+                results.append((id_number, None))
+        return results
 
-    def get(self, list_name, id_number):
-        task_id = self._parse_id(list_name, id_number)
-        task = self.db.hgetall(task_id)
-        return self.serialise(task)
+    def get(self, list_name, id_number, version=None):
+        scope = self._parse_scope(list_name)
+        task = self.cache.get(scope, str(id_number), version)
+        if task is not None:
+            return task
+        task = self._get_ordered(list_name, [id_number])[0][1]
+        if not task:
+            raise self._does_not_exist(id_number)
+        self.cache.set(scope, str(id_number), task, version)
+        return task
 
     def update(self, list_name, id_number, new_data):
-        old_task = self.get(list_name, id_number)
-        updated_task = self._parse_updated_task(old_task, new_data)
-        task_id = self._parse_id(list_name, id_number)
-        self.db.hmset(task_id, updated_task)
-        return updated_task
+        task = self.update_script(
+            keys=self._update_keys(list_name, id_number),
+            args=self._update_args(list_name, id_number, new_data),
+            client=self.db
+        )
+        if task is None:
+            raise self._does_not_exist(id_number)
+        self.cache.invalidate(self._parse_scope(list_name))
+        return self._parse_update_reply(task)
 
     def delete(self, list_name, id_number):
-        task_id = self._parse_id(list_name, id_number)
-        self.db.delete(task_id)
-        self.index.remove(list_name, id_number)
+        """Deletes a task, returning False if it did not exist."""
+        deleted = self.delete_script(
+            keys=self._delete_keys(list_name, id_number),
+            args=self._delete_args(list_name, id_number),
+            client=self.db
+        )
+        if deleted:
+            self.cache.invalidate(self._parse_scope(list_name))
+        return bool(deleted)
+
+    def version(self, list_name):
+        """Returns a counter that changes on every write to the list."""
+        return int(self.db.get(self._parse_version_id(list_name)) or 0)
+
+    def search(self, query, list_names=None, limit=20, offset=0):
+        """
+        Returns the number of tasks whose names share a word with query and
+        a page of them, best match first, optionally only from list_names.
+        The index spans lists, so it is not kept in cluster mode.
+        """
+        if self.index.hash_tags:
+            raise NotSupported('Search is not available in cluster mode')
+        total, matches = self.search_index.search(tokenize(query),
+            list_names, limit, offset)
+        tasks = self._get_references([(list_name, id_number)
+            for list_name, id_number, _ in matches])
+        results = [{'list': list_name, 'id': int(id_number), 'score': score,
+                'task': task}
+            for (list_name, id_number, score), task in zip(matches, tasks)
+            if task]
+        return total, results
+
+    def changes(self, list_name, since):
+        """Returns the logged changes after version `since`, oldest first."""
+        return self.change_log.since(list_name, since)
+
+    def listen(self, list_name, timeout):
+        """Subscribes to the changes of a list, see ChangeLog.listen."""
+        return self.change_log.listen(list_name, timeout)
+
+    def delta(self, list_name, since):
+        """
+        Returns the list version, the tasks changed after version `since`
+        and the ids deleted since, or None if the change log has been
+        trimmed past `since`.
+        """
+        log = self.change_log.parse_id(list_name)
+        pipe = self.db.pipeline(transaction=False)
+        pipe.get(self._parse_version_id(list_name))
+        pipe.zrange(log, 0, 0, withscores=True)
+        pipe.zrangebyscore(log, '(%d' % since, '+inf', withscores=True)
+        version, oldest, changes = pipe.execute()
+        version = int(version or 0)
+        # Writes landing between the reads are left for the next delta.
+        changes = [change for change, score in changes if score <= version]
+        if since > version:
+            return None
+        if since < version and (not oldest or oldest[0][1] > since + 1):
+            return None
+        changed = []
+        deleted = []
+        for change in map(json.loads, changes):
+            id_number = str(change['id'])
+            for ids in (changed, deleted):
+                if id_number in ids:
+                    ids.remove(id_number)
+            (deleted if change['op'] == 'delete' else changed).append(
+                id_number)
+        tasks = {}
+        for id_number, task in self._get_ordered(list_name, changed):
+            if task:
+                tasks[id_number] = task
+            else:
+                deleted.append(id_number)
+        return version, tasks, deleted
+
+    def count(self, list_name):
+        """Returns the number of tasks, done tasks and undone tasks."""
+        pipe = self.db.pipeline(transaction=False)
+        for done in (None, True, False):
+            pipe.zcard(self.index.parse_id(list_name, done))
+        total, done, undone = pipe.execute()
+        return {'total': total, 'done': done, 'undone': undone}
 
     def exists(self, list_name, id_number):
-        task_id = self._parse_id(list_name, id_number)
-        if not self.db.exists(task_id):
-            raise DoesNotExist("Task with id %s does not exist." % id_number)
+        if not self._get_ordered(list_name, [id_number])[0][1]:
+            raise self._does_not_exist(id_number)
         return True
 
     def serialise(self, task):
@@ -54,25 +497,464 @@ class TaskManager():
     def _parse_bool(self, done):
         return True if done == 'True' else False
 
+    def _get_many(self, list_name, id_numbers):
+        objects = {}
+        for id_number, task in self._get_ordered(list_name, id_numbers):
+            objects[id_number] = task
+        return objects
+
+    def _get_ordered(self, list_name, id_numbers):
+        pipe = self.db.pipeline(transaction=False)
+        self._queue_reads(pipe, list_name, id_numbers)
+        tasks = self._parse_reads(id_numbers, pipe.execute())
+        return zip(id_numbers, tasks)
+
+    def _get_references(self, references):
+        """Reads tasks from (list_name, id_number) pairs in one round trip."""
+        pipe = self.db.pipeline(transaction=False)
+        counts = [self._queue_reads(pipe, list_name, [id_number])
+            for list_name, id_number in references]
+        replies = pipe.execute()
+        tasks = []
+        for (list_name, id_number), count in zip(references, counts):
+            tasks.extend(self._parse_reads([id_number], replies[:count]))
+            replies = replies[count:]
+        return tasks
+
+    def _queue_reads(self, pipe, list_name, id_numbers):
+        """Queues the reads for id_numbers and returns how many it queued."""
+        for id_number in id_numbers:
+            pipe.hgetall(self._parse_id(list_name, id_number))
+        return len(id_numbers)
+
+    def _parse_reads(self, id_numbers, replies):
+        """Returns the tasks read by _queue_reads, {} for missing ones."""
+        return [self.serialise(task) for task in replies]
+
+    def _parse_update_reply(self, reply):
+        return self.serialise(dict(zip(reply[::2], reply[1::2])))
+
+    def _run_operation(self, client, list_name, op, id_number, data):
+        if op == 'create':
+            return self.create_script(
+                keys=self._create_keys(list_name),
+                args=self._create_args(list_name, self._parse_new_task(data)),
+                client=client
+            )
+        elif op == 'update':
+            return self.update_script(
+                keys=self._update_keys(list_name, id_number),
+                args=self._update_args(list_name, id_number, data),
+                client=client
+            )
+        elif op == 'delete':
+            return self.delete_script(
+                keys=self._delete_keys(list_name, id_number),
+                args=self._delete_args(list_name, id_number),
+                client=client
+            )
+
+    def _parse_scope(self, list_name):
+        return "list:%s" % list_name
+
+    def _create_keys(self, list_name):
+        return ["%s:counter" % self._parse_list_id(list_name),
+            self.index.parse_id(list_name),
+            self._parse_version_id(list_name)] + \
+            self._done_keys(list_name) + self._log_keys(list_name)
+
+    def _create_args(self, list_name, task):
+        return [list_name, task['name'], task['done']] + \
+            self._log_args(list_name) + \
+            [self.max_list_size, self._parse_list_id(list_name)] + \
+            self._search_args(task['name'])
+
+    def _update_keys(self, list_name, id_number):
+        return [self._parse_id(list_name, id_number),
+            self._parse_version_id(list_name)] + \
+            self._done_keys(list_name) + self._log_keys(list_name)
+
+    def _delete_keys(self, list_name, id_number):
+        return [self._parse_id(list_name, id_number),
+            self.index.parse_id(list_name),
+            self._parse_version_id(list_name)] + \
+            self._done_keys(list_name) + self._log_keys(list_name)
+
+    def _delete_args(self, list_name, id_number):
+        return [id_number, list_name] + self._log_args(list_name) + \
+            ['0' if self.index.hash_tags else '1']
+
+    def _done_keys(self, list_name):
+        return [self.index.parse_id(list_name, True),
+            self.index.parse_id(list_name, False)]
+
+    def _log_keys(self, list_name):
+        return [self.change_log.parse_id(list_name)]
+
+    def _log_args(self, list_name):
+        return [self.change_log.size, self.change_log.parse_channel(list_name)]
+
+    def _search_args(self, name=None):
+        """
+        Returns the search flag and name tokens the task scripts take, which
+        leave the search index alone when there is no name to index or in
+        cluster mode, where its keys would be in other slots.
+        """
+        if name is None or self.index.hash_tags:
+            return ['0', '']
+        return ['1', self.search_index.terms(name)]
+
+    def _parse_version_id(self, list_name):
+        return "%s:version" % self._parse_list_id(list_name)
+
+    def _parse_list_id(self, list_name):
+        return self.index.parse_list_id(list_name)
+
     def _parse_id(self, list_name, id_number):
         return "%(list_name)s:%(id_number)s" % {
-            "list_name": list_name,
+            "list_name": self._parse_list_id(list_name),
             "id_number": id_number
         }
 
-    def _get_id_number(self, list_name):
-        counter_name = "%s:counter" % list_name
-        self.db.incr(counter_name)
-        return self.db.get(counter_name)
+    def _update_args(self, list_name, id_number, new_data):
+        return [id_number, list_name] + self._log_args(list_name) + \
+            self._search_args(new_data.get('name')) + \
+            self._parse_updated_fields(new_data)
 
-    def _parse_new_task(self, new_data):
-        task = dict()
-        task['name'] = new_data['name']
-        task['done'] = new_data.get('done', False)
-        return task
+    def _parse_updated_fields(self, new_data):
+        fields = []
+        for field_name in ('name', 'done'):
+            if field_name in new_data:
+                fields.extend([field_name, new_data[field_name]])
+        return fields
+
+
+class PackedTaskManager(TaskManager):
+    """
+    Packs a list's tasks into bucket hashes, `<list>:tasks:<id / 100>`,
+    instead of one key per task. Each field is a task id and each value is
+    '1' or '0' for done followed by the name. Buckets stay small enough for
+    Redis to keep them in its compact ziplist encoding as long as names are
+    under 63 bytes, which saves most of the per-key overhead.
+    """
+    bucket_size = 100
+    create_script = CREATE_PACKED_TASK
+    update_script = UPDATE_PACKED_TASK
+    delete_script = DELETE_PACKED_TASK
+
+    def delete(self, list_name, id_number):
+        if not str(id_number).isdigit():
+            return False
+        return TaskManager.delete(self, list_name, id_number)
+
+    def pack(self, task):
+        return ('1' if task['done'] else '0') + self._encode(task['name'])
+
+    def unpack(self, value):
+        if value is None:
+            return {}
+        return {'name': value[1:], 'done': value[0] == '1'}
+
+    def _queue_reads(self, pipe, list_name, id_numbers):
+        buckets = self._group_by_bucket(id_numbers)
+        for bucket, bucket_ids in buckets:
+            pipe.hmget(self._parse_bucket_id(list_name, bucket), bucket_ids)
+        return len(buckets)
+
+    def _parse_reads(self, id_numbers, replies):
+        values = {}
+        for (_, bucket_ids), reply in zip(
+                self._group_by_bucket(id_numbers), replies):
+            values.update(zip(bucket_ids, reply))
+        return [self.unpack(values[str(id_number)])
+            for id_number in id_numbers]
+
+    def _parse_update_reply(self, reply):
+        return self.unpack(reply)
+
+    def _group_by_bucket(self, id_numbers):
+        buckets = {}
+        for id_number in id_numbers:
+            buckets.setdefault(self._bucket(id_number), []).append(
+                str(id_number))
+        return sorted(buckets.items())
+
+    def _bucket(self, id_number):
+        return int(id_number) // self.bucket_size
+
+    def _parse_bucket_id(self, list_name, bucket):
+        return "%s:tasks:%d" % (self._parse_list_id(list_name), bucket)
+
+    def _encode(self, name):
+        if isinstance(name, unicode):
+            return name.encode('utf-8')
+        return name
+
+    def _create_args(self, list_name, task):
+        return [list_name, self.bucket_size, self.pack(task)] + \
+            self._log_args(list_name) + \
+            [self.max_list_size, self._parse_list_id(list_name)] + \
+            self._search_args(task['name'])
+
+    def _update_keys(self, list_name, id_number):
+        return [self._parse_bucket_id(list_name, self._bucket(id_number)),
+            self._parse_version_id(list_name)] + \
+            self._done_keys(list_name) + self._log_keys(list_name)
+
+    def _update_args(self, list_name, id_number, new_data):
+        args = [id_number, list_name] + self._log_args(list_name) + \
+            self._search_args(new_data.get('name')) + ['']
+        if 'done' in new_data:
+            args[-1] = '1' if new_data['done'] else '0'
+        if 'name' in new_data:
+            args.append(self._encode(new_data['name']))
+        return args
+
+    def _delete_keys(self, list_name, id_number):
+        return [self._parse_bucket_id(list_name, self._bucket(id_number)),
+            self.index.parse_id(list_name),
+            self._parse_version_id(list_name)] + \
+            self._done_keys(list_name) + self._log_keys(list_name)
+
+
+class SqlTaskManager(BaseTaskManager):
+    """TaskManager backed by the SQL tables in app/sql.py."""
+    def __init__(self, db):
+        self.db = db
+
+    def all(self, list_name, done=None, version=None):
+        return self._to_dict(self._select(self.db.engine, list_name,
+            done=done))
+
+    def page(self, list_name, limit, cursor=None, done=None):
+        rows = self._select(self.db.engine, list_name, cursor, limit + 1,
+            done)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1].id)
+        return self._to_dict(rows), next_cursor
+
+    def head(self, list_name, limit, done=None):
+        with self.db.engine.connect() as connection:
+            rows = self._select(connection, list_name, limit=limit, done=done)
+            total = self._count(connection, list_name, done)
+        return self._to_dict(rows), total
+
+    def expand(self, list_names, limit):
+        objects = {}
+        with self.db.engine.connect() as connection:
+            for list_name in list_names:
+                objects[list_name] = self._to_dict(
+                    self._select(connection, list_name, limit=limit))
+        return objects
+
+    def iterate(self, list_name, batch_size, done=None):
+        cursor = None
+        while True:
+            rows = self._select(self.db.engine, list_name, cursor, batch_size,
+                done)
+            for row in rows:
+                yield str(row.id), self._to_task(row)
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1].id
+
+    def create(self, list_name, request_json):
+        task = self._parse_new_task(request_json)
+        with self.db.engine.begin() as connection:
+            if not self._room(connection, list_name, 1):
+                raise self._list_full(list_name)
+            id_number = self._allocate_ids(connection, list_name, 1)
+            connection.execute(tasks.insert(), list_name=list_name,
+                id=id_number, **task)
+        return str(id_number), task
+
+    def bulk(self, list_name, operations):
+        """
+        Runs the updates and deletes in order, then inserts every created
+        task with one batched statement, all in one transaction.
+        """
+        results = [None] * len(operations)
+        created = []
+        with self.db.engine.begin() as connection:
+            for position, (op, id_number, data) in enumerate(operations):
+                if op == 'create':
+                    created.append(position)
+                    continue
+                if op == 'update':
+                    row = self._update(connection, list_name, id_number, data)
+                    found = row is not None
+                    task = self._to_task(row) if found else None
+                else:
+                    found = self._delete(connection, list_name, id_number)
+                    task = None
+                if found:
+                    results[position] = (id_number, task)
+                else:
+                    results[position] = self._does_not_exist(id_number)
+            room = self._room(connection, list_name, len(created))
+            for position in created[room:]:
+                results[position] = self._list_full(list_name)
+            created = created[:room]
+            if created:
+                first_id = self._allocate_ids(connection, list_name,
+                    len(created))
+                rows = []
+                for offset, position in enumerate(created):
+                    task = self._parse_new_task(operations[position][2])
+                    rows.append(dict(task, list_name=list_name,
+                        id=first_id + offset))
+                    results[position] = (str(first_id + offset), task)
+                connection.execute(tasks.insert(), rows)
+        return results
+
+    def get(self, list_name, id_number, version=None):
+        row = self.db.engine.execute(self._select_one(list_name, id_number)) \
+            .first()
+        if row is None:
+            raise self._does_not_exist(id_number)
+        return self._to_task(row)
+
+    def update(self, list_name, id_number, new_data):
+        with self.db.engine.begin() as connection:
+            row = self._update(connection, list_name, id_number, new_data)
+        if row is None:
+            raise self._does_not_exist(id_number)
+        return self._to_task(row)
+
+    def delete(self, list_name, id_number):
+        """Deletes a task, returning False if it did not exist."""
+        if not str(id_number).isdigit():
+            return False
+        with self.db.engine.begin() as connection:
+            return self._delete(connection, list_name, id_number)
+
+    def version(self, list_name):
+        query = select([lists.c.version]).where(lists.c.list_name == list_name)
+        return self.db.engine.execute(query).scalar() or 0
+
+    def search(self, query, list_names=None, limit=20, offset=0):
+        """
+        Matches each word of query against task names with LIKE, as SQLite
+        has no inverted index here, and ranks by the number matched.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return 0, []
+        score = sum(case([(tasks.c.name.like(u'%%%s%%' % token), 1)], else_=0)
+            for token in tokens)
+        matches = select([tasks, score.label('score')]).where(score > 0)
+        if list_names is not None:
+            matches = matches.where(tasks.c.list_name.in_(list_names))
+        with self.db.engine.connect() as connection:
+            total = connection.execute(select([func.count()])
+                .select_from(matches.alias())).scalar()
+            rows = connection.execute(matches
+                .order_by(score.desc(), tasks.c.list_name, tasks.c.id)
+                .limit(limit).offset(offset)).fetchall()
+        return total, [{'list': row.list_name, 'id': row.id,
+                'score': row.score, 'task': self._to_task(row)}
+            for row in rows]
+
+    def changes(self, list_name, since):
+        """Changes are not logged in SQL storage."""
+        return []
+
+    def delta(self, list_name, since):
+        """Without a change log, clients always get a full snapshot."""
+        return None
+
+    def listen(self, list_name, timeout):
+        raise NotSupported('Change events need Redis storage')
+
+    def count(self, list_name):
+        """Returns the number of tasks, done tasks and undone tasks."""
+        query = select([tasks.c.done, func.count()]) \
+            .where(tasks.c.list_name == list_name).group_by(tasks.c.done)
+        counts = dict(self.db.engine.execute(query).fetchall())
+        done, undone = counts.get(True, 0), counts.get(False, 0)
+        return {'total': done + undone, 'done': done, 'undone': undone}
+
+    def exists(self, list_name, id_number):
+        self.get(list_name, id_number)
+        return True
+
+    def _select(self, connection, list_name, cursor=None, limit=None,
+            done=None):
+        query = select([tasks]).where(tasks.c.list_name == list_name)
+        if done is not None:
+            query = query.where(tasks.c.done == done)
+        if cursor is not None:
+            query = query.where(tasks.c.id > int(cursor))
+        query = query.order_by(tasks.c.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return connection.execute(query).fetchall()
+
+    def _select_one(self, list_name, id_number):
+        return select([tasks]).where(self._task_clause(list_name, id_number))
+
+    def _task_clause(self, list_name, id_number):
+        return and_(tasks.c.list_name == list_name,
+            tasks.c.id == int(id_number))
+
+    def _update(self, connection, list_name, id_number, new_data):
+        values = dict((field_name, new_data[field_name])
+            for field_name in ('name', 'done') if field_name in new_data)
+        if values:
+            result = connection.execute(tasks.update()
+                .where(self._task_clause(list_name, id_number))
+                .values(**values))
+            if result.rowcount:
+                self._bump_version(connection, list_name)
+        return connection.execute(self._select_one(list_name, id_number)) \
+            .first()
+
+    def _delete(self, connection, list_name, id_number):
+        result = connection.execute(tasks.delete()
+            .where(self._task_clause(list_name, id_number)))
+        if result.rowcount:
+            self._bump_version(connection, list_name)
+        return bool(result.rowcount)
+
+    def _count(self, connection, list_name, done=None):
+        query = select([func.count()]).where(tasks.c.list_name == list_name)
+        if done is not None:
+            query = query.where(tasks.c.done == done)
+        return connection.execute(query).scalar()
+
+    def _room(self, connection, list_name, count):
+        """Returns how many of `count` new tasks the list has room for."""
+        if not self.max_list_size:
+            return count
+        free = self.max_list_size - self._count(connection, list_name)
+        return max(0, min(count, free))
+
+    def _allocate_ids(self, connection, list_name, count):
+        """Reserves `count` ids and bumps the version, returning the first."""
+        result = connection.execute(lists.update()
+            .where(lists.c.list_name == list_name)
+            .values(counter=lists.c.counter + count,
+                version=lists.c.version + 1))
+        if not result.rowcount:
+            connection.execute(lists.insert(), list_name=list_name,
+                counter=count, version=1)
+            return 1
+        counter = connection.execute(select([lists.c.counter])
+            .where(lists.c.list_name == list_name)).scalar()
+        return counter - count + 1
+
+    def _bump_version(self, connection, list_name):
+        result = connection.execute(lists.update()
+            .where(lists.c.list_name == list_name)
+            .values(version=lists.c.version + 1))
+        if not result.rowcount:
+            connection.execute(lists.insert(), list_name=list_name,
+                counter=0, version=1)
+
+    def _to_dict(self, rows):
+        return dict((str(row.id), self._to_task(row)) for row in rows)
 
-    def _parse_updated_task(self, old_task, new_data):
-        updated_task = dict()
-        updated_task['name'] = new_data.get('name', old_task['name'])
-        updated_task['done'] = new_data.get('done', old_task['done'])
-        return updated_task
+    def _to_task(self, row):
+        return {'name': row.name, 'done': row.done}
@@ -1,52 +1,305 @@
-from flask import jsonify, request
+from flask import request, current_app, Response, stream_with_context
 from flask.ext.classy import FlaskView, route
-from ..core import task_manager, task_validator, auth
+from ..core import task_manager, profile_manager, task_validator, \
+    bulk_operation_validator, auth, rate_limiter
+from ..exceptions import ApiError, DoesNotExist, ValidationError
+from ..connections import read_from_primary
+from ..handlers import not_modified
+from ..models import tokenize
+from ..responses import dumps, json_response
 
 
 class TasksView(FlaskView):
     route_prefix = '/api/checklist/'
     route_base = '/'
+    rate_limit_classes = {'search': 'search', 'bulk': 'bulk'}
 
     @auth.login_required
-    def before_request(self, *args, **kwargs):
-        pass
-
-    def before_get(self, list_name, id_number):
-        task_manager.exists(list_name, id_number)
+    def before_request(self, name, *args, **kwargs):
+        rate_limiter.check(self.rate_limit_classes.get(name))
 
     @route('/<list_name>/<int:id_number>', methods=['GET'])
     def get(self, list_name, id_number):
-        task = task_manager.get(list_name, id_number)
-        return jsonify({id_number: task})
+        version = task_manager.version(list_name)
+        etag = str(version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        task = task_manager.get(list_name, id_number, version)
+        response = json_response({id_number: task})
+        response.set_etag(etag, weak=True)
+        return response
 
     def before_patch(self, list_name, id_number):
         task_validator.validate(request.json, required_fields=[])
-        task_manager.exists(list_name, id_number)
 
     @route('/<list_name>/<int:id_number>', methods=['PATCH', 'PUT'])
     def patch(self, list_name, id_number):
-        task_manager.update(list_name, id_number, request.json)
-        updated_task = task_manager.get(list_name, id_number)
-        return jsonify({id_number: updated_task})
-
-    def before_delete(self, list_name, id_number):
-        task_manager.exists(list_name, id_number)
+        updated_task = task_manager.update(list_name, id_number, request.json)
+        return json_response({id_number: updated_task})
 
     @route('/<list_name>/<int:id_number>', methods=['DELETE'])
     def delete(self, list_name, id_number):
-        task_manager.delete(list_name, id_number)
-        return jsonify({"success": True}), 204
+        if not task_manager.delete(list_name, id_number):
+            raise DoesNotExist("Task with id %s does not exist." % id_number)
+        return json_response({"success": True}), 204
 
     @route('/<list_name>', methods=['GET'])
     def get_list(self, list_name):
-        tasks = task_manager.all(list_name)
-        return jsonify(tasks)
+        done = self._parse_done_arg()
+        fields = self._parse_fields_arg()
+        since = self._parse_since_arg()
+        stream = self._parse_stream_args()
+        first = self._parse_first_arg() if 'first' in request.args else None
+        page = self._parse_page_args() if 'limit' in request.args else None
+        version = task_manager.version(list_name)
+        etag = str(version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        if since is not None:
+            response = json_response(self._get_delta(list_name, since, fields))
+        elif stream is not None:
+            response = self._stream_list(list_name, stream, done, fields)
+        elif first is not None:
+            tasks, total = task_manager.head(list_name, first, done)
+            response = json_response({'tasks': self._project(tasks, fields),
+                'total': total, 'truncated': total > first})
+        elif page is None:
+            tasks = task_manager.all(list_name, done, version)
+            response = json_response(self._project(tasks, fields))
+        else:
+            limit, cursor = page
+            tasks, next_cursor = task_manager.page(list_name, limit, cursor,
+                done)
+            response = json_response(self._project(tasks, fields))
+            if next_cursor is not None:
+                response.headers['X-Next-Cursor'] = next_cursor
+        response.set_etag(etag, weak=True)
+        return response
+
+    @route('/_search', methods=['GET'])
+    def search(self):
+        query = request.args.get('q', '')
+        if not tokenize(query):
+            raise ValidationError('q must contain at least one word')
+        list_names = self._parse_search_scope()
+        limit, offset = self._parse_search_page_args()
+        total, results = task_manager.search(query, list_names, limit, offset)
+        return json_response({'total': total, 'results': results})
+
+    @route('/<list_name>/_events', methods=['GET'])
+    def events(self, list_name):
+        last_event_id = request.headers.get('Last-Event-ID',
+            request.args.get('last_event_id'))
+        if last_event_id is not None and not last_event_id.isdigit():
+            raise ValidationError('Last-Event-ID must be a list version')
+        # Subscribe before reading the log, so nothing falls in between, and
+        # read the log from the primary, which a replica may lag behind.
+        read_from_primary()
+        changes = task_manager.listen(list_name,
+            current_app.config['EVENTS_KEEPALIVE'])
+        if last_event_id is None:
+            last_version = task_manager.version(list_name)
+            missed = []
+        else:
+            last_version = int(last_event_id)
+            missed = task_manager.changes(list_name, last_version)
+
+        def generate():
+            version = last_version
+            for change in missed:
+                version = change['version']
+                yield self._format_event(change)
+            for change in changes:
+                if change is None:
+                    yield ': keepalive\n\n'
+                elif change['version'] > version:
+                    version = change['version']
+                    yield self._format_event(change)
+
+        return Response(stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache'})
+
+    @route('/<list_name>/_count', methods=['GET'])
+    def count(self, list_name):
+        return json_response(task_manager.count(list_name))
 
     def before_post(self, list_name):
         task_validator.validate(request.json, required_fields=['name'])
 
     @route('/<list_name>', methods=['POST'])
     def post(self, list_name):
-        id_number = int(task_manager.create(list_name, request.json))
-        task = task_manager.get(list_name, id_number)
-        return jsonify({id_number: task}), 201
+        id_number, task = task_manager.create(list_name, request.json)
+        return json_response({id_number: task}), 201
+
+    def before_bulk(self, list_name):
+        if not isinstance(request.json, list):
+            raise ValidationError('request body must be a list of operations')
+        max_operations = current_app.config['MAX_BULK_OPERATIONS']
+        if len(request.json) > max_operations:
+            raise ValidationError(
+                'a bulk request can contain at most %s operations' %
+                max_operations)
+
+    @route('/<list_name>/_bulk', methods=['POST'])
+    def bulk(self, list_name):
+        parsed = []
+        for operation in request.json:
+            try:
+                parsed.append(self._parse_operation(operation))
+            except ValidationError as error:
+                parsed.append(error)
+        operations = [op for op in parsed if not isinstance(op, ApiError)]
+        results = iter(task_manager.bulk(list_name, operations))
+        response = []
+        for operation in parsed:
+            if isinstance(operation, ApiError):
+                response.append(self._bulk_result(None, operation))
+            else:
+                result = next(results)
+                response.append(self._bulk_result(operation[0], result))
+        return json_response({'results': response})
+
+    def _parse_operation(self, operation):
+        bulk_operation_validator.validate(operation)
+        op = operation['op']
+        if op == 'create':
+            task_validator.validate(operation['task'], required_fields=['name'])
+        elif op == 'update':
+            task_validator.validate(operation['task'], required_fields=[])
+        return op, operation.get('id'), operation.get('task')
+
+    def _bulk_result(self, op, result):
+        if isinstance(result, ApiError):
+            return {'status': result.status_code, 'error': result.message}
+        id_number, task = result
+        if op == 'delete':
+            return {'status': 204, 'id': int(id_number)}
+        status = 201 if op == 'create' else 200
+        return {'status': status, 'id': int(id_number), 'task': task}
+
+    def _parse_page_args(self):
+        max_page_size = current_app.config['MAX_PAGE_SIZE']
+        limit = request.args.get('limit', type=int)
+        if limit is None or not 0 < limit <= max_page_size:
+            raise ValidationError(
+                'limit must be an integer between 1 and %s' % max_page_size)
+        cursor = request.args.get('cursor')
+        if cursor is not None and not cursor.isdigit():
+            raise ValidationError('cursor must be a task id')
+        return limit, cursor
+
+    def _parse_first_arg(self):
+        max_page_size = current_app.config['MAX_PAGE_SIZE']
+        first = request.args.get('first', type=int)
+        if first is None or not 0 < first <= max_page_size:
+            raise ValidationError(
+                'first must be an integer between 1 and %s' % max_page_size)
+        return first
+
+    def _get_delta(self, list_name, since, fields):
+        delta = task_manager.delta(list_name, since)
+        if delta is None:
+            version = task_manager.version(list_name)
+            tasks = task_manager.all(list_name)
+            return {'version': version, 'snapshot': True,
+                'changed': self._project(tasks, fields), 'deleted': []}
+        version, tasks, deleted = delta
+        return {'version': version, 'snapshot': False,
+            'changed': self._project(tasks, fields),
+            'deleted': [int(id_number) for id_number in deleted]}
+
+    def _parse_since_arg(self):
+        since = request.args.get('since')
+        if since is not None and not since.isdigit():
+            raise ValidationError('since must be a list version')
+        return None if since is None else int(since)
+
+    def _format_event(self, change):
+        return 'id: %d\ndata: %s\n\n' % (change['version'],
+            dumps(change))
+
+    def _parse_search_scope(self):
+        list_name = request.args.get('list')
+        profile_name = request.args.get('profile')
+        if list_name is not None and profile_name is not None:
+            raise ValidationError('search either a list or a profile')
+        if list_name is not None:
+            return [list_name]
+        if profile_name is not None:
+            if not profile_manager.exists(profile_name):
+                raise DoesNotExist(
+                    "Profile '%s' does not exist." % profile_name)
+            return profile_manager.get(profile_name)
+        return None
+
+    def _parse_search_page_args(self):
+        max_page_size = current_app.config['MAX_PAGE_SIZE']
+        limit = request.args.get('limit',
+            current_app.config['SEARCH_PAGE_SIZE'], type=int)
+        if not 0 < limit <= max_page_size:
+            raise ValidationError(
+                'limit must be an integer between 1 and %s' % max_page_size)
+        offset = request.args.get('offset', 0, type=int)
+        if offset < 0:
+            raise ValidationError('offset must not be negative')
+        return limit, offset
+
+    def _parse_done_arg(self):
+        done = request.args.get('done')
+        if done not in (None, 'true', 'false'):
+            raise ValidationError("done must be 'true' or 'false'")
+        return None if done is None else done == 'true'
+
+    def _parse_fields_arg(self):
+        if 'fields' not in request.args:
+            return None
+        fields = request.args['fields'].split(',')
+        for field_name in fields:
+            if field_name not in ('name', 'done'):
+                raise ValidationError('fields can only contain name and done')
+        return fields
+
+    def _project(self, tasks, fields):
+        if fields is None:
+            return tasks
+        return dict((id_number, self._project_task(task, fields))
+            for id_number, task in tasks.iteritems())
+
+    def _project_task(self, task, fields):
+        if fields is None:
+            return task
+        return dict((field_name, task[field_name]) for field_name in fields
+            if field_name in task)
+
+    def _parse_stream_args(self):
+        if request.accept_mimetypes.best == 'application/x-ndjson':
+            return 'ndjson'
+        stream = request.args.get('stream')
+        if stream not in (None, 'json', 'ndjson'):
+            raise ValidationError("stream must be 'json' or 'ndjson'")
+        return stream
+
+    def _stream_list(self, list_name, stream, done=None, fields=None):
+        batch_size = current_app.config['STREAM_BATCH_SIZE']
+        tasks = ((id_number, self._project_task(task, fields))
+            for id_number, task in task_manager.iterate(list_name, batch_size,
+                done))
+
+        def generate_json():
+            separator = '{'
+            for id_number, task in tasks:
+                yield '%s%s:%s' % (separator, dumps(id_number),
+                    dumps(task))
+                separator = ','
+            yield '{}' if separator == '{' else '}'
+
+        def generate_ndjson():
+            for id_number, task in tasks:
+                yield dumps({id_number: task}) + '\n'
+
+        if stream == 'ndjson':
+            return Response(stream_with_context(generate_ndjson()),
+                mimetype='application/x-ndjson')
+        return Response(stream_with_context(generate_json()),
+            mimetype='application/json')
@@ -0,0 +1,98 @@
+import unittest
+import time
+from flask import Flask
+from redis import StrictRedis
+from ..cache import Cache
+from ..models import IndexManager
+from ..tasks.models import TaskManager
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.redis = StrictRedis()
+        self.cache = Cache(db=self.redis)
+        self.cache.enabled = True
+        self.cache.max_size = 2
+        self.cache.ttl = 5
+
+    def test_should_count_hits_and_misses(self):
+        self.assertEqual(self.cache.get('list:test', '1'), None)
+        self.cache.set('list:test', '1', {'name': 'first'})
+        self.assertEqual(self.cache.get('list:test', '1'), {'name': 'first'})
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_should_evict_least_recently_used(self):
+        self.cache.set('list:test', '1', 'first')
+        self.cache.set('list:test', '2', 'second')
+        self.cache.get('list:test', '1')
+        self.cache.set('list:test', '3', 'third')
+        self.assertEqual(self.cache.get('list:test', '2'), None)
+        self.assertEqual(self.cache.get('list:test', '1'), 'first')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_should_expire_entries(self):
+        self.cache.ttl = 0
+        self.cache.set('list:test', '1', 'first')
+        time.sleep(0.01)
+        self.assertEqual(self.cache.get('list:test', '1'), None)
+
+    def test_should_invalidate_a_scope(self):
+        self.cache.set('list:test', '1', 'first')
+        self.cache.set('list:other', '1', 'other')
+        self.cache.invalidate('list:test')
+        self.assertEqual(self.cache.get('list:test', '1'), None)
+        self.assertEqual(self.cache.get('list:other', '1'), 'other')
+
+    def test_should_miss_on_another_version(self):
+        self.cache.set('list:test', '1', 'first', 3)
+        self.assertEqual(self.cache.get('list:test', '1', 4), None)
+        self.cache.set('list:test', '1', 'second', 4)
+        self.assertEqual(self.cache.get('list:test', '1', 4), 'second')
+        self.assertEqual(self.cache.get('list:test', '1'), 'second')
+
+    def test_should_not_use_redis_without_redis_storage(self):
+        app = Flask(__name__)
+        app.config.update(CACHE_ENABLED=True, STORAGE='sqlite')
+        cache = Cache(db=None)
+        cache.init_app(app)
+        self.assertIsNone(cache.listener)
+        cache.set('list:test', '1', 'first')
+        cache.invalidate('list:test')
+        self.assertEqual(cache.get('list:test', '1'), None)
+
+    def test_should_invalidate_on_task_writes(self):
+        task_manager = TaskManager(db=self.redis,
+            index=IndexManager(db=self.redis), cache=self.cache)
+        id_number, _ = task_manager.create('test_list', {'name': 'first'})
+        task_manager.all('test_list')
+        task_manager.update('test_list', id_number, {'done': True})
+        self.assertEqual(task_manager.all('test_list'),
+            {id_number: {'name': 'first', 'done': True}})
+
+    def test_should_not_serve_tasks_older_than_the_version(self):
+        task_manager = TaskManager(db=self.redis,
+            index=IndexManager(db=self.redis), cache=self.cache)
+        # Another worker's write, whose invalidation this one missed.
+        other_worker = TaskManager(db=self.redis,
+            index=IndexManager(db=self.redis))
+        id_number, _ = task_manager.create('test_list', {'name': 'first'})
+        version = task_manager.version('test_list')
+        task_manager.all('test_list', version=version)
+        task_manager.get('test_list', id_number, version)
+        other_worker.update('test_list', id_number, {'done': True})
+        version = task_manager.version('test_list')
+        expected = {'name': 'first', 'done': True}
+        self.assertEqual(task_manager.all('test_list', version=version),
+            {id_number: expected})
+        self.assertEqual(task_manager.get('test_list', id_number, version),
+            expected)
+
+    def tearDown(self):
+        for key in self.redis.keys('test_list:*'):
+            self.redis.delete(key)
+
+
+if __name__ == '__main__':
+    unittest.main()
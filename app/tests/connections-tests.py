@@ -0,0 +1,164 @@
+import socket
+import time
+import unittest
+from flask import Flask
+from redis import StrictRedis
+from redis.exceptions import ConnectionError, TimeoutError
+from ..connections import ReplicatedRedis, RetryingConnection, \
+    RetryingUnixConnection, read_from_primary, init_redis, parse_addresses, \
+    subscribe_forever
+
+
+class FailingConnection(RetryingConnection):
+    """Fails to connect `failures` times before connecting for real."""
+    failures = 0
+    attempts = 0
+
+    def _connect(self):
+        FailingConnection.attempts += 1
+        if FailingConnection.attempts <= self.failures:
+            raise socket.error('refused')
+        return super(FailingConnection, self)._connect()
+
+
+class ClientHolder():
+    def __init__(self, connection):
+        self.connection = connection
+
+
+class FakePubSub():
+    """Returns the given messages, raising any that are exceptions."""
+    def __init__(self, messages):
+        self.messages = messages
+        self.channels = []
+
+    def subscribe(self, channel):
+        self.channels.append(channel)
+
+    def get_message(self):
+        message = self.messages.pop(0)
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+
+class FakeRedis():
+    def __init__(self, *pubsubs):
+        self.pubsubs = list(pubsubs)
+
+    def pubsub(self):
+        return self.pubsubs.pop(0)
+
+
+class ReplicatedRedisTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.redis = ReplicatedRedis()
+        self.redis.replica = StrictRedis(db=1)
+        self.redis.set('connections_test', 'primary')
+        self.redis.replica.set('connections_test', 'replica')
+        self.redis.zadd('connections_test:set', 1, 'primary')
+
+    def test_should_read_from_the_replica_in_get_requests(self):
+        with self.app.test_request_context(method='GET'):
+            self.assertEqual(self.redis.get('connections_test'), 'replica')
+            read_from_primary()
+            self.assertEqual(self.redis.get('connections_test'), 'primary')
+        with self.app.test_request_context(method='POST'):
+            self.assertEqual(self.redis.get('connections_test'), 'primary')
+        self.assertEqual(self.redis.get('connections_test'), 'primary')
+
+    def test_should_send_read_only_pipelines_to_the_replica(self):
+        with self.app.test_request_context(method='GET'):
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get('connections_test')
+            pipe.exists('connections_test')
+            self.assertEqual(pipe.execute(), ['replica', True])
+
+    def test_should_send_pipelines_that_write_to_the_primary(self):
+        with self.app.test_request_context(method='GET'):
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zunionstore('connections_test:union',
+                ['connections_test:set'])
+            pipe.zrange('connections_test:union', 0, -1)
+            pipe.delete('connections_test:union')
+            self.assertEqual(pipe.execute(), [1, ['primary'], 1])
+            pipe.get('connections_test')
+            self.assertEqual(pipe.execute(), ['replica'])
+
+    def tearDown(self):
+        self.redis.delete('connections_test', 'connections_test:set')
+        self.redis.replica.delete('connections_test')
+
+
+class RetryingConnectionTestCase(unittest.TestCase):
+    def setUp(self):
+        FailingConnection.attempts = 0
+
+    def test_should_retry_connects_with_backoff(self):
+        FailingConnection.failures = 2
+        connection = FailingConnection(connect_retries=2, retry_backoff=0.01)
+        started = time.time()
+        connection.connect()
+        self.assertEqual(FailingConnection.attempts, 3)
+        self.assertGreaterEqual(time.time() - started, 0.03)
+        connection.disconnect()
+
+    def test_should_give_up_after_the_last_retry(self):
+        FailingConnection.failures = 5
+        connection = FailingConnection(connect_retries=1, retry_backoff=0)
+        with self.assertRaises(ConnectionError):
+            connection.connect()
+        self.assertEqual(FailingConnection.attempts, 2)
+
+    def test_should_keep_unix_sockets(self):
+        app = Flask(__name__)
+        app.config.update(REDIS_CONNECT_RETRIES=1, REDIS_RETRY_BACKOFF=0,
+            REDIS_MAX_CONNECTIONS=10)
+        client = ClientHolder(
+            ReplicatedRedis(unix_socket_path='/tmp/checklist-test.sock'))
+        init_redis(app, client)
+        pool = client.connection.connection_pool
+        self.assertIs(pool.connection_class, RetryingUnixConnection)
+        self.assertEqual(pool.make_connection().path,
+            '/tmp/checklist-test.sock')
+
+
+class SubscribeForeverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.resets = 0
+
+    def handle(self, message):
+        if message == 'stop':
+            raise KeyError(message)
+        self.handled.append(message)
+
+    def reset(self):
+        self.resets += 1
+
+    def test_should_resubscribe_after_any_redis_error(self):
+        db = FakeRedis(FakePubSub([TimeoutError('timed out')]),
+            FakePubSub(['first', None, 'stop']))
+        with self.assertRaises(KeyError):
+            subscribe_forever(db, lambda pubsub: pubsub.subscribe('test'),
+                self.handle, self.reset, 0)
+        self.assertEqual(self.handled, ['first'])
+        self.assertEqual(self.resets, 2)
+
+    def test_should_reset_when_it_stops(self):
+        db = FakeRedis(FakePubSub(['stop']))
+        with self.assertRaises(KeyError):
+            subscribe_forever(db, lambda pubsub: pubsub.subscribe('test'),
+                self.handle, self.reset, 0)
+        self.assertEqual(self.resets, 1)
+
+
+class ParseAddressesTestCase(unittest.TestCase):
+    def test_should_parse_host_and_port_pairs(self):
+        self.assertEqual(parse_addresses('one:26379, two.example:26380'),
+            [('one', 26379), ('two.example', 26380)])
+
+
+if __name__ == '__main__':
+    unittest.main()
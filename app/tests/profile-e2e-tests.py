@@ -2,6 +2,7 @@ import unittest
 import json
 from app.factory import create_app
 from ..profiles.models import ProfileManager
+from ..core import task_manager
 from redis import Redis
 
 
@@ -27,6 +28,36 @@ class GetItemTest(ProfileTestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_get_expanded(self):
+        id_number, _ = task_manager.create('checklist', {'name': 'expanded'})
+        response = self.app.get('/api/profile/%s?expand=tasks' % 'test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            }
+        )
+        task_manager.delete('checklist', id_number)
+        self.assertEqual(response.status_code, 200)
+        tasks = json.loads(response.data)['tasks']
+        self.assertEqual(tasks['checklist'][id_number],
+            {'name': 'expanded', 'done': False})
+
+    def test_get_not_modified(self):
+        response = self.app.get('/api/profile/%s' % 'test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            }
+        )
+        response = self.app.get('/api/profile/%s' % 'test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'If-None-Match': response.headers['ETag']
+            }
+        )
+        self.assertEqual(response.status_code, 304)
+
     def test_get_without_auth(self):
         response = self.app.get('/api/profile/%s' % 'test',
             headers={
@@ -105,6 +136,31 @@ class PatchTest(ProfileTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('another_list', response.data)
 
+    def test_patch_changes(self):
+        data = {'add': ['another_list'], 'remove': ['checklist']}
+        response = self.app.patch('api/profile/%s' % 'test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            },
+            data=json.dumps(data)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('another_list', response.data)
+        self.assertNotIn('checklist', response.data)
+
+    def test_patch_nonexistent_profile(self):
+        data = {'lists': ['test']}
+        response = self.app.put('api/profile/%s' % 'absent',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            },
+            data=json.dumps(data)
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('does not exist', response.data)
+
     def test_without_auth(self):
         data = {'lists': ['test', 'another_list']}
         response = self.app.put('api/profile/%s' % 'test',
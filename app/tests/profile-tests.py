@@ -1,6 +1,7 @@
 import unittest
 from redis import Redis
 from ..profiles.models import ProfileManager
+from ..exceptions import DoesNotExist
 
 
 class ProfileManagerTestCase(unittest.TestCase):
@@ -39,9 +40,32 @@ class ProfileManagerTestCase(unittest.TestCase):
         for item in updated_profile:
             self.assertIn(item, updated_profile)
 
+    def test_should_not_update_a_missing_profile(self):
+        with self.assertRaises(DoesNotExist):
+            self.profile_manager.update('blabla', {'lists': ['list']})
+        self.assertEqual(self.profile_manager.exists('blabla'), False)
+
+    def test_should_add_and_remove_lists(self):
+        profile = self.profile_manager.update_lists('test', {
+            'add': ['list', 'test'],
+            'remove': ['another_list']
+        })
+        self.assertEqual(sorted(profile), ['list', 'test'])
+        self.assertEqual(self.profile_manager.get('test'), profile)
+
+    def test_should_hash_tag_profile_keys_in_cluster_mode(self):
+        self.profile_manager.hash_tags = True
+        self.profile_manager.create('new_profile', {'lists': ['test']})
+        self.profile_manager.update_lists('new_profile', {'add': ['other']})
+        self.assertEqual(self.redis.lrange('profile:{new_profile}', 0, -1),
+            ['test', 'other'])
+        self.assertEqual(self.redis.get('profile:{new_profile}:version'), '2')
+
     def tearDown(self):
         self.redis.delete('profile:test')
         self.redis.delete('profile:new_profile')
+        self.redis.delete('profile:{new_profile}')
+        self.redis.delete('profile:{new_profile}:version')
 
 
 if __name__ == '__main__':
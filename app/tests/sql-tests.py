@@ -0,0 +1,178 @@
+import unittest
+from flask import Flask
+from ..core import sql
+from ..sql import metadata
+from ..tasks.models import SqlTaskManager
+from ..profiles.models import SqlProfileManager
+from ..users.models import SqlUserManager
+from ..cache import Cache
+from ..exceptions import DoesNotExist, ListFull, NotSupported
+
+
+class SqlTestCase(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        sql.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        metadata.create_all(sql.engine)
+
+    def tearDown(self):
+        metadata.drop_all(sql.engine)
+        self.context.pop()
+
+
+class SqlTaskManagerTestCase(SqlTestCase):
+    def setUp(self):
+        super(SqlTaskManagerTestCase, self).setUp()
+        self.task_manager = SqlTaskManager(db=sql)
+        self.id, _ = self.task_manager.create('test', {'name': 'first'})
+
+    def test_should_create_tasks_with_increasing_ids(self):
+        id_number, task = self.task_manager.create('test', {'name': 'second'})
+        self.assertEqual(id_number, '2')
+        self.assertEqual(task, {'name': 'second', 'done': False})
+
+    def test_should_get_a_task(self):
+        task = self.task_manager.get('test', self.id)
+        self.assertEqual(task, {'name': 'first', 'done': False})
+
+    def test_should_raise_if_task_does_not_exist(self):
+        with self.assertRaises(DoesNotExist):
+            self.task_manager.get('test', 99)
+
+    def test_should_update_a_task(self):
+        task = self.task_manager.update('test', self.id, {'done': True})
+        self.assertEqual(task, {'name': 'first', 'done': True})
+
+    def test_should_delete_a_task(self):
+        self.assertTrue(self.task_manager.delete('test', self.id))
+        self.assertFalse(self.task_manager.delete('test', self.id))
+        self.assertEqual(self.task_manager.all('test'), {})
+
+    def test_should_bump_version_on_writes(self):
+        version = self.task_manager.version('test')
+        self.task_manager.update('test', self.id, {'name': 'renamed'})
+        self.assertGreater(self.task_manager.version('test'), version)
+
+    def test_should_page_through_tasks(self):
+        for name in ('second', 'third'):
+            self.task_manager.create('test', {'name': name})
+        tasks, cursor = self.task_manager.page('test', 2)
+        self.assertEqual(sorted(tasks), ['1', '2'])
+        tasks, cursor = self.task_manager.page('test', 2, cursor)
+        self.assertEqual(sorted(tasks), ['3'])
+        self.assertIsNone(cursor)
+
+    def test_should_iterate_over_tasks_in_batches(self):
+        for name in ('second', 'third'):
+            self.task_manager.create('test', {'name': name})
+        ids = [id_number for id_number, _ in
+            self.task_manager.iterate('test', 2)]
+        self.assertEqual(ids, ['1', '2', '3'])
+
+    def test_should_run_bulk_operations(self):
+        results = self.task_manager.bulk('test', [
+            ('create', None, {'name': 'second'}),
+            ('update', self.id, {'done': True}),
+            ('delete', 99, {}),
+        ])
+        self.assertEqual(results[0], ('2', {'name': 'second', 'done': False}))
+        self.assertEqual(results[1], (self.id, {'name': 'first', 'done': True}))
+        self.assertIsInstance(results[2], DoesNotExist)
+
+    def test_should_refuse_tasks_beyond_the_maximum_list_size(self):
+        self.task_manager.max_list_size = 2
+        results = self.task_manager.bulk('test', [
+            ('create', None, {'name': 'second'}),
+            ('create', None, {'name': 'third'}),
+        ])
+        self.assertEqual(results[0], ('2', {'name': 'second', 'done': False}))
+        self.assertIsInstance(results[1], ListFull)
+        with self.assertRaises(ListFull):
+            self.task_manager.create('test', {'name': 'third'})
+        self.assertEqual(self.task_manager.head('test', 1),
+            ({'1': {'name': 'first', 'done': False}}, 2))
+
+    def test_should_not_support_change_events(self):
+        with self.assertRaises(NotSupported):
+            self.task_manager.listen('test', 1)
+
+    def test_should_search_task_names(self):
+        self.task_manager.create('test', {'name': 'second first'})
+        self.task_manager.create('other', {'name': 'first'})
+        total, results = self.task_manager.search('first second', ['test'])
+        self.assertEqual(total, 2)
+        self.assertEqual([(result['id'], result['score'])
+            for result in results], [(2, 2), (1, 1)])
+
+
+class SqlProfileManagerTestCase(SqlTestCase):
+    def setUp(self):
+        super(SqlProfileManagerTestCase, self).setUp()
+        self.profile_manager = SqlProfileManager(db=sql)
+        self.profile_manager.create('test', {'lists': ['test', 'another']})
+
+    def test_should_prepend_lists_on_create(self):
+        self.profile_manager.create('test', {'lists': ['new']})
+        self.assertEqual(self.profile_manager.get('test'),
+            ['new', 'test', 'another'])
+
+    def test_should_check_if_profile_exists(self):
+        self.assertTrue(self.profile_manager.exists('test'))
+        self.assertFalse(self.profile_manager.exists('blabla'))
+
+    def test_should_update_a_profile(self):
+        lists = self.profile_manager.update('test', {'lists': ['a', 'b']})
+        self.assertEqual(lists, ['a', 'b'])
+
+    def test_should_add_and_remove_lists(self):
+        lists = self.profile_manager.update_lists('test',
+            {'add': ['third', 'test'], 'remove': ['another']})
+        self.assertEqual(lists, ['test', 'third'])
+
+    def test_should_raise_when_updating_missing_profile(self):
+        with self.assertRaises(DoesNotExist):
+            self.profile_manager.update('blabla', {'lists': ['a']})
+
+    def test_should_delete_a_profile(self):
+        version = self.profile_manager.version('test')
+        self.profile_manager.delete('test')
+        self.assertFalse(self.profile_manager.exists('test'))
+        self.assertGreater(self.profile_manager.version('test'), version)
+
+
+class SqlUserManagerTestCase(SqlTestCase):
+    def setUp(self):
+        super(SqlUserManagerTestCase, self).setUp()
+        cache = Cache(db=None)
+        cache.enabled = True
+        cache.local = True
+        cache.max_size = 10
+        cache.ttl = 5
+        self.user_manager = SqlUserManager(db=sql, cache=cache)
+        self.user_manager.create('alice', 'secret')
+
+    def test_should_verify_a_stored_user(self):
+        self.assertTrue(self.user_manager.exists('alice'))
+        self.assertTrue(self.user_manager.verify('alice', 'secret'))
+        self.assertFalse(self.user_manager.verify('alice', 'wrong'))
+        self.assertFalse(self.user_manager.verify('bob', 'secret'))
+
+    def test_should_change_a_password(self):
+        self.assertTrue(self.user_manager.verify('alice', 'secret'))
+        self.user_manager.create('alice', 'changed')
+        self.assertFalse(self.user_manager.verify('alice', 'secret'))
+        self.assertTrue(self.user_manager.verify('alice', 'changed'))
+
+    def test_should_delete_a_user(self):
+        self.assertTrue(self.user_manager.verify('alice', 'secret'))
+        self.assertTrue(self.user_manager.delete('alice'))
+        self.assertFalse(self.user_manager.delete('alice'))
+        self.assertFalse(self.user_manager.exists('alice'))
+        self.assertFalse(self.user_manager.verify('alice', 'secret'))
+
+
+if __name__ == '__main__':
+    unittest.main()
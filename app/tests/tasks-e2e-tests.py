@@ -1,7 +1,9 @@
 from app.factory import create_app
-from app.core import task_manager
+from app.core import task_manager, rate_limiter, redis
+from app.responses import msgpack
 import unittest
 import json
+import zlib
 
 
 class ChecklistTestCase(unittest.TestCase):
@@ -17,12 +19,12 @@ class ChecklistTestCase(unittest.TestCase):
             "name": "dummy task",
             "done": False
         }
-        self.test_1 = task_manager.create('test', task_1)
+        self.test_1, _ = task_manager.create('test', task_1)
         task_2 = {
             "name": "dummy task 2",
             "done": True
         }
-        self.test_2 = task_manager.create('test', task_2)
+        self.test_2, _ = task_manager.create('test', task_2)
 
     def tearDown(self):
         task_manager.delete('test', self.test_1)
@@ -44,6 +46,269 @@ class GetListTest(ChecklistTestCase):
         self.assertIn(str(self.test_1), response.data)
         self.assertIn(str(self.test_2), response.data)
 
+    def test_get_reports_redis_usage(self):
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertIn('redis;dur=', response.headers['Server-Timing'])
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+        response = self.app.get('/metrics',
+            headers={'Authorization': 'Basic dGVzdDpwYXNz'})
+        self.assertIn('checklist_redis_commands_total{method="GET",'
+            'route="/api/checklist/<list_name>"}', response.data)
+
+    def test_get_filtered_fields(self):
+        response = self.app.get('/api/checklist/test?done=true&fields=name',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data),
+            {self.test_2: {'name': 'dummy task 2'}})
+
+    def test_get_invalid_filter(self):
+        response = self.app.get('/api/checklist/test?done=maybe',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 400)
+
+    def test_search(self):
+        response = self.app.get('/api/checklist/_search?q=task+2&list=test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.assertEqual(results[0]['id'], int(self.test_2))
+        self.assertEqual(results[0]['score'], 2)
+
+    def test_search_without_words(self):
+        response = self.app.get('/api/checklist/_search?q=+',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_since_version(self):
+        version = task_manager.version('test')
+        task_manager.update('test', self.test_1, {'done': True})
+        response = self.app.get('/api/checklist/test?since=%d' % version,
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            'version': version + 1,
+            'snapshot': False,
+            'changed': {self.test_1: {'name': 'dummy task', 'done': True}},
+            'deleted': []
+        })
+
+    def test_get_since_trimmed_version(self):
+        response = self.app.get('/api/checklist/test?since=0',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        delta = json.loads(response.data)
+        self.assertEqual(delta['version'], task_manager.version('test'))
+        self.assertEqual(sorted(delta['changed']),
+            sorted([self.test_1, self.test_2]))
+
+    def test_events_resume_from_last_event_id(self):
+        version = task_manager.version('test')
+        response = self.app.get('/api/checklist/test/_events',
+            headers={
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'Last-Event-ID': str(version - 1)
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        event = next(iter(response.response))
+        response.close()
+        self.assertTrue(event.startswith('id: %d\ndata: ' % version))
+        self.assertEqual(json.loads(event.split('data: ')[1])['id'],
+            int(self.test_2))
+
+    def test_count(self):
+        response = self.app.get('/api/checklist/test/_count',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data),
+            {'total': 2, 'done': 1, 'undone': 1})
+
+    def test_count_rate_limited(self):
+        redis.delete('ratelimit:test:TasksView:count')
+        try:
+            self._assert_count_rate_limited()
+        finally:
+            redis.delete('ratelimit:test:TasksView:count')
+
+    def test_count_rate_limited_in_process(self):
+        local = rate_limiter.local
+        rate_limiter.local = True
+        rate_limiter.buckets.clear()
+        try:
+            self._assert_count_rate_limited()
+        finally:
+            rate_limiter.local = local
+            rate_limiter.buckets.clear()
+
+    def _assert_count_rate_limited(self):
+        limits = rate_limiter.limits
+        rate_limiter.limits = dict(limits, read=(0.5, 1))
+        try:
+            for expected in (200, 429):
+                response = self.app.get('/api/checklist/test/_count',
+                    headers={
+                        'Content-Type': 'application/json',
+                        'Authorization': 'Basic dGVzdDpwYXNz'
+                    })
+                self.assertEqual(response.status_code, expected)
+            self.assertEqual(response.headers['Retry-After'], '2')
+        finally:
+            rate_limiter.limits = limits
+
+    def test_get_first(self):
+        response = self.app.get('/api/checklist/test?first=1',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            'tasks': {self.test_1: {'name': 'dummy task', 'done': False}},
+            'total': 2,
+            'truncated': True
+        })
+
+    def test_get_stream(self):
+        response = self.app.get('/api/checklist/test?stream=json',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            self.test_1: {'name': 'dummy task', 'done': False},
+            self.test_2: {'name': 'dummy task 2', 'done': True}
+        })
+
+    def test_get_ndjson_stream(self):
+        response = self.app.get('/api/checklist/test?stream=ndjson',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        lines = response.data.splitlines()
+        self.assertEqual(json.loads(lines[0]),
+            {self.test_1: {'name': 'dummy task', 'done': False}})
+        self.assertEqual(len(lines), 2)
+
+    def test_get_gzip(self):
+        app = create_app()
+        app.config['COMPRESSION_MIN_SIZE'] = 0
+        response = app.test_client().get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'Accept-Encoding': 'gzip'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        data = zlib.decompress(response.data, 16 + zlib.MAX_WBITS)
+        self.assertIn(str(self.test_1), data)
+
+    def test_get_small_uncompressed(self):
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'Accept-Encoding': 'gzip'
+            })
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(str(self.test_1), response.data)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_get_msgpack(self):
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'Accept': 'application/x-msgpack'
+            })
+        self.assertEqual(response.mimetype, 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.data)[self.test_1],
+            {'name': 'dummy task', 'done': False})
+
+    def test_get_not_modified(self):
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        etag = response.headers['ETag']
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'If-None-Match': etag
+            })
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(etag.upper().startswith('W/'))
+        response = self.app.get('/api/checklist/test?limit=0',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'If-None-Match': etag
+            })
+        self.assertEqual(response.status_code, 400)
+        task_manager.update('test', self.test_1, {'done': True})
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz',
+                'If-None-Match': etag
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_page(self):
+        response = self.app.get('/api/checklist/test?limit=1',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(self.test_1), response.data)
+        self.assertNotIn(str(self.test_2), response.data)
+        self.assertEqual(response.headers['X-Next-Cursor'], str(self.test_1))
+        self.assertIn('X-Next-Cursor',
+            response.headers['Access-Control-Expose-Headers'])
+
+    def test_get_page_bad_limit(self):
+        response = self.app.get('/api/checklist/test?limit=0',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit must be an integer', response.data)
+
     def test_get_without_auth(self):
         response = self.app.get('/api/checklist/test',
             headers={
@@ -209,6 +474,53 @@ class PostTest(ChecklistTestCase):
         task_manager.delete('new_list', self.new_list_1)
         task_manager.delete('new_list', self.new_list_2)
 
+class BulkTest(ChecklistTestCase):
+    def setUp(self):
+        super(BulkTest, self).setUp()
+        self.test_3 = None
+
+    def test_bulk(self):
+        data = [
+            {'op': 'create', 'task': {'name': 'item 3'}},
+            {'op': 'update', 'id': int(self.test_1), 'task': {'done': True}},
+            {'op': 'delete', 'id': 150},
+            {'op': 'create', 'task': {'done': True}},
+        ]
+        response = self.app.post('/api/checklist/test/_bulk',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            },
+            data=json.dumps(data)
+            )
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.test_3 = results[0]['id']
+        self.assertEqual(results[0]['status'], 201)
+        self.assertEqual(results[0]['task']['name'], 'item 3')
+        self.assertEqual(results[1]['status'], 200)
+        self.assertEqual(results[1]['task'],
+            {'name': 'dummy task', 'done': True})
+        self.assertEqual(results[2]['status'], 404)
+        self.assertIn('does not exist', results[2]['error'])
+        self.assertEqual(results[3]['status'], 400)
+        self.assertIn('name field is required', results[3]['error'])
+
+    def test_bulk_bad_request(self):
+        response = self.app.post('/api/checklist/test/_bulk',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            },
+            data=json.dumps({'op': 'create'})
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('list of operations', response.data)
+
+    def tearDown(self):
+        super(BulkTest, self).tearDown()
+        task_manager.delete('test', self.test_3)
+
 class DeleteTest(ChecklistTestCase):
     def setUp(self):
         super(DeleteTest, self).setUp()
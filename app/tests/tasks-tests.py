@@ -0,0 +1,264 @@
+import unittest
+from redis import StrictRedis
+from ..models import IndexManager
+from ..exceptions import DoesNotExist, ListFull, NotSupported
+from ..tasks.models import TaskManager, PackedTaskManager
+
+
+class TaskManagerTestCase(unittest.TestCase):
+    manager_class = TaskManager
+    hash_tags = False
+
+    def setUp(self):
+        self.redis = StrictRedis()
+        self.task_manager = self.manager_class(
+            db=self.redis,
+            index=IndexManager(db=self.redis)
+        )
+        self.task_manager.index.hash_tags = self.hash_tags
+        self.task_manager.change_log.hash_tags = self.hash_tags
+        self.test_1, _ = self.task_manager.create('test_list',
+            {'name': 'first', 'done': False})
+        self.test_2, _ = self.task_manager.create('test_list',
+            {'name': 'second', 'done': True})
+
+    def test_should_get_all_tasks_in_a_list(self):
+        tasks = self.task_manager.all('test_list')
+        self.assertEqual(tasks, {
+            self.test_1: {'name': 'first', 'done': False},
+            self.test_2: {'name': 'second', 'done': True}
+        })
+
+    def test_should_create_a_task_with_the_next_id(self):
+        id_number, task = self.task_manager.create('test_list',
+            {'name': 'third'})
+        self.assertEqual(id_number, '3')
+        self.assertEqual(task, {'name': 'third', 'done': False})
+        self.assertEqual(self.task_manager.get('test_list', id_number), task)
+        self.assertEqual(self.task_manager.index.get('test_list'),
+            [self.test_1, self.test_2, id_number])
+
+    def test_should_raise_if_task_does_not_exist(self):
+        with self.assertRaises(DoesNotExist):
+            self.task_manager.get('test_list', 150)
+        with self.assertRaises(DoesNotExist):
+            self.task_manager.update('test_list', 150, {'done': True})
+
+    def test_should_update_a_task(self):
+        task = self.task_manager.update('test_list', self.test_1,
+            {'done': True})
+        self.assertEqual(task, {'name': 'first', 'done': True})
+        self.assertEqual(self.task_manager.get('test_list', self.test_1), task)
+
+    def test_should_delete_a_task(self):
+        self.assertTrue(self.task_manager.delete('test_list', self.test_1))
+        self.assertFalse(self.task_manager.delete('test_list', self.test_1))
+        self.assertEqual(self.task_manager.all('test_list').keys(),
+            [self.test_2])
+
+    def test_should_iterate_over_a_list_in_batches(self):
+        test_3, _ = self.task_manager.create('test_list', {'name': 'third'})
+        tasks = list(self.task_manager.iterate('test_list', 2))
+        self.assertEqual([id_number for id_number, _ in tasks],
+            [self.test_1, self.test_2, test_3])
+
+    def test_should_filter_and_count_by_done(self):
+        test_3, _ = self.task_manager.create('test_list', {'name': 'third'})
+        self.task_manager.update('test_list', self.test_1, {'done': True})
+        self.task_manager.delete('test_list', self.test_2)
+        self.assertEqual(self.task_manager.all('test_list', done=True), {
+            self.test_1: {'name': 'first', 'done': True}
+        })
+        tasks, _ = self.task_manager.page('test_list', 10, done=False)
+        self.assertEqual(tasks.keys(), [test_3])
+        self.assertEqual(self.task_manager.count('test_list'),
+            {'total': 2, 'done': 1, 'undone': 1})
+
+    def test_should_get_empty_list(self):
+        self.assertEqual(self.task_manager.all('absent_list'), {})
+
+    def test_should_page_through_a_list_in_id_order(self):
+        test_3, _ = self.task_manager.create('test_list',
+            {'name': 'third', 'done': False})
+        tasks, cursor = self.task_manager.page('test_list', 2)
+        self.assertEqual(sorted(tasks.keys()), [self.test_1, self.test_2])
+        self.assertEqual(cursor, self.test_2)
+        tasks, cursor = self.task_manager.page('test_list', 2, cursor)
+        self.assertEqual(tasks.keys(), [test_3])
+        self.assertEqual(cursor, None)
+
+    def test_should_get_the_head_of_a_list_with_its_size(self):
+        tasks, total = self.task_manager.head('test_list', 1)
+        self.assertEqual(tasks, {self.test_1: {'name': 'first', 'done': False}})
+        self.assertEqual(total, 2)
+
+    def test_should_refuse_tasks_beyond_the_maximum_list_size(self):
+        self.task_manager.max_list_size = 3
+        self.task_manager.create('test_list', {'name': 'third'})
+        with self.assertRaises(ListFull):
+            self.task_manager.create('test_list', {'name': 'fourth'})
+        results = self.task_manager.bulk('test_list', [
+            ('delete', self.test_1, {}),
+            ('create', None, {'name': 'fourth'}),
+            ('create', None, {'name': 'fifth'}),
+        ])
+        self.assertEqual(results[1], ('4', {'name': 'fourth', 'done': False}))
+        self.assertIsInstance(results[2], ListFull)
+        self.assertEqual(len(self.task_manager.all('test_list')), 3)
+
+    def test_should_migrate_an_unordered_index(self):
+        self.redis.delete('test_list:index')
+        self.redis.sadd('test_list:ids', self.test_1, self.test_2)
+        self.task_manager.index.migrate('test_list')
+        self.assertFalse(self.redis.exists('test_list:ids'))
+        self.assertEqual(self.task_manager.index.get('test_list'),
+            [self.test_1, self.test_2])
+
+    def test_should_search_task_names(self):
+        test_3, _ = self.task_manager.create('test_list',
+            {'name': u'First Caf\xe9 order'})
+        total, results = self.task_manager.search('first cafe', ['test_list'])
+        self.assertEqual(total, 2)
+        self.assertEqual([result['id'] for result in results],
+            [int(test_3), int(self.test_1)])
+        self.assertEqual(results[0]['score'], 2)
+        total, results = self.task_manager.search('first', limit=1, offset=1)
+        self.assertEqual(len(results), 1)
+
+    def test_should_keep_search_index_up_to_date(self):
+        self.task_manager.update('test_list', self.test_1, {'name': 'renamed'})
+        self.task_manager.delete('test_list', self.test_2)
+        self.assertEqual(self.task_manager.search('first', ['test_list']),
+            (0, []))
+        self.assertEqual(self.task_manager.search('second', ['test_list']),
+            (0, []))
+        total, results = self.task_manager.search('renamed', ['test_list'])
+        self.assertEqual(results[0]['task'], {'name': 'renamed', 'done': False})
+
+    def test_should_index_bulk_writes(self):
+        self.task_manager.bulk('test_list', [
+            ('create', None, {'name': 'third'}),
+            ('update', self.test_1, {'name': 'renamed'}),
+            ('delete', self.test_2, None),
+        ])
+        self.assertEqual(self.task_manager.search('third', ['test_list'])[0],
+            1)
+        self.assertEqual(self.task_manager.search('renamed')[0], 1)
+        self.assertEqual(self.task_manager.search('first second')[0], 0)
+        self.assertEqual(self.redis.hkeys('test_list:_terms'),
+            [self.test_1, '3'])
+
+    def test_should_log_changes(self):
+        version = self.task_manager.version('test_list')
+        self.task_manager.update('test_list', self.test_1, {'done': True})
+        self.task_manager.delete('test_list', self.test_2)
+        self.assertEqual(self.task_manager.changes('test_list', version - 1), [
+            {'op': 'create', 'list': 'test_list', 'id': int(self.test_2),
+                'version': version,
+                'fields': {'name': 'second', 'done': True}},
+            {'op': 'update', 'list': 'test_list', 'id': int(self.test_1),
+                'version': version + 1, 'fields': {'done': True}},
+            {'op': 'delete', 'list': 'test_list', 'id': int(self.test_2),
+                'version': version + 2},
+        ])
+
+    def test_should_return_changes_since_a_version(self):
+        version = self.task_manager.version('test_list')
+        test_3, _ = self.task_manager.create('test_list', {'name': 'third'})
+        self.task_manager.update('test_list', self.test_1, {'done': True})
+        self.task_manager.delete('test_list', self.test_2)
+        self.assertEqual(self.task_manager.delta('test_list', version), (
+            version + 3,
+            {test_3: {'name': 'third', 'done': False},
+                self.test_1: {'name': 'first', 'done': True}},
+            [self.test_2]
+        ))
+        self.assertEqual(self.task_manager.delta('test_list', version + 3),
+            (version + 3, {}, []))
+
+    def test_should_not_return_changes_past_the_log(self):
+        self.task_manager.change_log.size = 1
+        version = self.task_manager.version('test_list')
+        self.task_manager.update('test_list', self.test_1, {'done': True})
+        self.task_manager.update('test_list', self.test_2, {'done': False})
+        self.assertIsNone(self.task_manager.delta('test_list', version))
+        self.assertIsNotNone(self.task_manager.delta('test_list', version + 1))
+
+    def test_should_publish_changes(self):
+        changes = self.task_manager.listen('test_list', 1)
+        self.task_manager.update('test_list', self.test_1, {'name': 'new'})
+        change = next(changes)
+        changes.close()
+        self.assertEqual(change['op'], 'update')
+        self.assertEqual(change['fields'], {'name': 'new'})
+
+    def test_should_share_one_subscription_between_streams(self):
+        changes = self.task_manager.listen('test_list', 1)
+        other = self.task_manager.listen('other_list', 0.1)
+        self.task_manager.update('test_list', self.test_1, {'done': True})
+        self.assertEqual(next(changes)['id'], int(self.test_1))
+        self.assertIsNone(next(other))
+        changes.close()
+        other.close()
+        self.assertEqual(self.task_manager.change_log.streams, {})
+
+    def tearDown(self):
+        self.task_manager.search_index.remove_list('test_list')
+        for key in self.redis.keys('test_list:*') + \
+                self.redis.keys('{test_list}:*'):
+            self.redis.delete(key)
+
+
+class PackedTaskManagerTestCase(TaskManagerTestCase):
+    manager_class = PackedTaskManager
+
+    def test_should_pack_tasks_into_bucket_hashes(self):
+        self.assertEqual(self.redis.hgetall('test_list:tasks:0'), {
+            self.test_1: '0first',
+            self.test_2: '1second'
+        })
+        self.assertFalse(self.redis.exists('test_list:%s' % self.test_1))
+
+
+class HashTaggedTaskManagerTestCase(TaskManagerTestCase):
+    hash_tags = True
+
+    def test_should_keep_a_lists_keys_in_one_slot(self):
+        self.assertTrue(self.redis.exists('{test_list}:%s' % self.test_1))
+        self.assertEqual(self.redis.zcard('{test_list}:index'), 2)
+        self.assertEqual(self.redis.get('{test_list}:counter'), '2')
+        self.assertEqual(self.redis.zcard('{test_list}:changes'), 2)
+        self.assertFalse(self.redis.exists('test_list:index'))
+
+    def test_should_search_task_names(self):
+        with self.assertRaises(NotSupported):
+            self.task_manager.search('first')
+        self.assertFalse(self.redis.exists('test_list:_terms'))
+
+    @unittest.skip('the search index is not kept in cluster mode')
+    def test_should_keep_search_index_up_to_date(self):
+        pass
+
+    def test_should_index_bulk_writes(self):
+        results = self.task_manager.bulk('test_list', [
+            ('create', None, {'name': 'third'}),
+            ('delete', self.test_2, None),
+            ('delete', self.test_2, None),
+        ])
+        self.assertEqual(results[0], ('3', {'name': 'third', 'done': False}))
+        self.assertEqual(results[1], (self.test_2, None))
+        self.assertIsInstance(results[2], DoesNotExist)
+        self.assertEqual(self.redis.keys('test_list:_*'), [])
+
+    def test_should_not_touch_the_search_index_on_delete(self):
+        self.redis.hset('test_list:_terms', self.test_1, 'first')
+        try:
+            self.assertTrue(self.task_manager.delete('test_list', self.test_1))
+            self.assertEqual(self.redis.hget('test_list:_terms', self.test_1),
+                'first')
+        finally:
+            self.redis.delete('test_list:_terms')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+from app.factory import create_app
+import unittest
+import json
+
+
+class TokenTest(unittest.TestCase):
+    def setUp(self):
+        app = create_app()
+        self.app = app.test_client()
+
+    def test_token(self):
+        response = self.app.post('/api/token',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDpwYXNz'
+            })
+        self.assertEqual(response.status_code, 201)
+        token = json.loads(response.data)['token']
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Bearer %s' % token
+            })
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_without_password(self):
+        response = self.app.post('/api/token',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Bearer invalid'
+            })
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_password(self):
+        response = self.app.get('/api/checklist/test',
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Basic dGVzdDp3cm9uZw=='
+            })
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
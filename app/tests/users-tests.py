@@ -0,0 +1,68 @@
+import time
+import unittest
+from flask import Flask
+from redis import StrictRedis
+from ..cache import Cache
+from ..users.models import UserManager
+
+
+class UserManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.redis = StrictRedis()
+        app = Flask(__name__)
+        app.config.update(SECRET_KEY='secret', USERNAME='admin',
+            PASSWORD='admin password', TOKEN_TTL=1)
+        self.cache = Cache(db=self.redis)
+        self.cache.enabled = True
+        self.cache.max_size = 10
+        self.cache.ttl = 5
+        self.user_manager = UserManager(db=self.redis, cache=self.cache)
+        self.user_manager.init_app(app)
+        self.user_manager.create('test_user', 'password')
+
+    def test_should_store_a_hashed_password(self):
+        stored = self.redis.hget('user:test_user', 'password')
+        self.assertNotIn('password', stored.split('$')[-1])
+
+    def test_should_verify_a_password(self):
+        self.assertTrue(self.user_manager.verify('test_user', 'password'))
+        self.assertFalse(self.user_manager.verify('test_user', 'wrong'))
+        self.assertFalse(self.user_manager.verify('nobody', 'password'))
+
+    def test_should_verify_the_configured_user(self):
+        self.assertTrue(self.user_manager.verify('admin', 'admin password'))
+        self.assertFalse(self.user_manager.verify('admin', 'password'))
+
+    def test_should_verify_non_ascii_passwords(self):
+        self.user_manager.create('test_user', u'caf\xe9')
+        self.assertTrue(self.user_manager.verify('test_user', 'caf\xc3\xa9'))
+        self.assertTrue(self.user_manager.verify('test_user', u'caf\xe9'))
+        self.assertFalse(self.user_manager.verify('test_user', 'caf\xe9'))
+
+    def test_should_cache_verified_credentials(self):
+        self.user_manager.verify('test_user', 'password')
+        hits = self.cache.hits
+        self.assertTrue(self.user_manager.verify('test_user', 'password'))
+        self.assertEqual(self.cache.hits, hits + 1)
+
+    def test_should_forget_cached_credentials_of_a_deleted_user(self):
+        self.user_manager.verify('test_user', 'password')
+        self.user_manager.delete('test_user')
+        self.assertFalse(self.user_manager.verify('test_user', 'password'))
+
+    def test_should_issue_and_verify_tokens(self):
+        token = self.user_manager.create_token('test_user')
+        self.assertEqual(self.user_manager.verify_token(token), 'test_user')
+        self.assertIsNone(self.user_manager.verify_token(token + 'x'))
+
+    def test_should_reject_expired_tokens(self):
+        token = self.user_manager.create_token('test_user')
+        time.sleep(2)
+        self.assertIsNone(self.user_manager.verify_token(token))
+
+    def tearDown(self):
+        self.redis.delete('user:test_user')
+
+
+if __name__ == '__main__':
+    unittest.main()
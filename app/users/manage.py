@@ -0,0 +1,24 @@
+"""
+Adds, changes and removes API users.
+
+    python -m app.users.manage add <username>
+    python -m app.users.manage remove <username>
+"""
+import getpass
+import sys
+
+
+if __name__ == '__main__':
+    from ..factory import create_app
+    from ..core import user_manager
+    create_app()
+    if sys.argv[1:2] == ['add'] and len(sys.argv) == 3:
+        user_manager.create(sys.argv[2], getpass.getpass())
+        print 'Saved user %s' % sys.argv[2]
+    elif sys.argv[1:2] == ['remove'] and len(sys.argv) == 3:
+        if user_manager.delete(sys.argv[2]):
+            print 'Removed user %s' % sys.argv[2]
+        else:
+            print 'No user %s' % sys.argv[2]
+    else:
+        print __doc__
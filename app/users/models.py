@@ -0,0 +1,131 @@
+import hashlib
+from itsdangerous import TimedJSONWebSignatureSerializer, BadSignature
+from werkzeug.security import generate_password_hash, check_password_hash, \
+    safe_str_cmp
+from sqlalchemy import select
+from ..cache import Cache
+from ..sql import users
+
+
+class BaseUserManager():
+    """
+    Stores users with a salted password hash. Verified credentials are kept
+    in an in-process cache for a short TTL, so repeat requests skip the
+    deliberately slow hash check, and signed bearer tokens let clients skip
+    it altogether until they expire.
+
+    The USERNAME and PASSWORD settings, if set, add a user that is not
+    stored.
+    """
+    def __init__(self, db, cache=None):
+        self.db = db
+        self.cache = cache if cache is not None else Cache(db=db)
+        self.default_user = None
+        self.serializer = None
+        self.token_ttl = 0
+
+    def init_app(self, app):
+        if app.config.get('USERNAME'):
+            self.default_user = (app.config['USERNAME'],
+                app.config.get('PASSWORD') or '')
+        self.token_ttl = app.config.get('TOKEN_TTL', 600)
+        if app.config.get('SECRET_KEY'):
+            self.serializer = TimedJSONWebSignatureSerializer(
+                app.config['SECRET_KEY'], expires_in=self.token_ttl)
+
+    def create(self, username, password):
+        """Adds a user, or changes the password of an existing one."""
+        raise NotImplementedError
+
+    def delete(self, username):
+        raise NotImplementedError
+
+    def exists(self, username):
+        raise NotImplementedError
+
+    def verify(self, username, password):
+        if not username or not password:
+            return False
+        scope = self._parse_id(username)
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        key = hashlib.sha256(password).hexdigest()
+        if self.cache.get(scope, key):
+            return True
+        if not self._check_password(username, password):
+            return False
+        self.cache.set(scope, key, True)
+        return True
+
+    def create_token(self, username):
+        return self.serializer.dumps({'user': username})
+
+    def verify_token(self, token):
+        """Returns the user a token was issued to, or None if it is invalid."""
+        if self.serializer is None:
+            return None
+        try:
+            return self.serializer.loads(token)['user']
+        except (BadSignature, KeyError, TypeError):
+            return None
+
+    def _check_password(self, username, password):
+        if self.default_user is not None and \
+                username == self.default_user[0]:
+            return safe_str_cmp(password, self.default_user[1])
+        password_hash = self._password_hash(username)
+        if password_hash is None:
+            return False
+        return check_password_hash(password_hash, password)
+
+    def _password_hash(self, username):
+        raise NotImplementedError
+
+    def _parse_id(self, username):
+        return "user:%s" % username
+
+
+class UserManager(BaseUserManager):
+    """Stores users as `user:<name>` hashes holding the password hash."""
+    def create(self, username, password):
+        self.db.hset(self._parse_id(username), 'password',
+            generate_password_hash(password))
+        self.cache.invalidate(self._parse_id(username))
+
+    def delete(self, username):
+        deleted = self.db.delete(self._parse_id(username))
+        self.cache.invalidate(self._parse_id(username))
+        return bool(deleted)
+
+    def exists(self, username):
+        return bool(self.db.exists(self._parse_id(username)))
+
+    def _password_hash(self, username):
+        return self.db.hget(self._parse_id(username), 'password')
+
+
+class SqlUserManager(BaseUserManager):
+    """UserManager backed by the SQL users table in app/sql.py."""
+    def create(self, username, password):
+        password_hash = generate_password_hash(password)
+        with self.db.engine.begin() as connection:
+            result = connection.execute(users.update()
+                .where(users.c.name == username)
+                .values(password=password_hash))
+            if not result.rowcount:
+                connection.execute(users.insert(), name=username,
+                    password=password_hash)
+        self.cache.invalidate(self._parse_id(username))
+
+    def delete(self, username):
+        result = self.db.engine.execute(users.delete()
+            .where(users.c.name == username))
+        self.cache.invalidate(self._parse_id(username))
+        return bool(result.rowcount)
+
+    def exists(self, username):
+        return self._password_hash(username) is not None
+
+    def _password_hash(self, username):
+        return self.db.engine.execute(select([users.c.password])
+            .where(users.c.name == username)).scalar()
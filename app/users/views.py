@@ -0,0 +1,23 @@
+from flask import request, g
+from flask.ext.classy import FlaskView, route
+from ..core import auth, user_manager, rate_limiter
+from ..responses import json_response
+
+
+class TokensView(FlaskView):
+    route_prefix = '/api/'
+    route_base = '/'
+
+    @auth.login_required
+    def before_request(self, *args, **kwargs):
+        rate_limiter.check()
+
+    @route('/token', methods=['POST'])
+    def token(self):
+        """Issues a bearer token, in exchange for a username and password."""
+        if request.authorization is None:
+            return auth.auth_error_callback()
+        if user_manager.serializer is None:
+            return json_response({'error': 'Tokens are not configured'}), 501
+        return json_response({'token': user_manager.create_token(g.user),
+            'expires_in': user_manager.token_ttl}), 201
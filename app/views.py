@@ -0,0 +1,16 @@
+from flask.ext.classy import FlaskView, route
+from .core import auth, cache, rate_limiter
+from .responses import json_response
+
+
+class StatsView(FlaskView):
+    route_prefix = '/api/'
+    route_base = '/_stats'
+
+    @auth.login_required
+    def before_request(self, *args, **kwargs):
+        rate_limiter.check()
+
+    @route('/cache', methods=['GET'])
+    def cache_stats(self):
+        return json_response(cache.stats())
@@ -0,0 +1,54 @@
+"""
+Measures the per-request cost of authentication in-process: HTTP Basic
+with the verified-credential cache off and on, and a bearer token. Each
+mode sends the same cheap request, so the differences are auth overhead.
+Needs a local redis-server; a `benchmark-user` user is created and
+removed.
+
+    python -m benchmarks.auth
+"""
+import base64
+import json
+import timeit
+from app.factory import create_app
+from app.core import credential_cache, user_manager, rate_limiter
+
+
+REQUESTS = 200
+REPEAT = 5
+USERNAME = 'benchmark-user'
+PASSWORD = 'benchmark password'
+PATH = '/api/checklist/benchmark:auth/_count'
+
+
+def per_request(client, headers):
+    timings = timeit.repeat(lambda: client.get(PATH, headers=headers),
+        number=REQUESTS, repeat=REPEAT)
+    return min(timings) / REQUESTS * 1000
+
+
+def main():
+    client = create_app().test_client()
+    rate_limiter.enabled = False
+    user_manager.create(USERNAME, PASSWORD)
+    basic = {'Authorization': 'Basic %s' %
+        base64.b64encode('%s:%s' % (USERNAME, PASSWORD))}
+    response = client.post('/api/token', headers=basic)
+    bearer = {'Authorization': 'Bearer %s' %
+        json.loads(response.data)['token']}
+    try:
+        credential_cache.enabled = False
+        uncached = per_request(client, basic)
+        credential_cache.enabled = True
+        cached = per_request(client, basic)
+        token = per_request(client, bearer)
+    finally:
+        user_manager.delete(USERNAME)
+    print '%-24s %10s' % ('auth', 'ms/request')
+    print '%-24s %10.3f' % ('basic, uncached', uncached)
+    print '%-24s %10.3f' % ('basic, cached', cached)
+    print '%-24s %10.3f' % ('bearer token', token)
+
+
+if __name__ == '__main__':
+    main()
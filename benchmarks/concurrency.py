@@ -0,0 +1,86 @@
+"""
+Measures throughput and latency of a running server as the number of
+concurrent clients grows. Start the server under test first, e.g.
+
+    RATE_LIMIT_ENABLED=false gunicorn -w 4 run:app
+    RATE_LIMIT_ENABLED=false gunicorn -w 4 -k gevent \
+        --worker-connections 1000 run_gevent:app
+
+with rate limiting off, so clients are not throttled, then point the
+benchmark at it:
+
+    python -m benchmarks.concurrency http://localhost:8000
+"""
+import base64
+import os
+import sys
+import threading
+import time
+import urllib2
+
+
+LIST_NAME = 'benchmark_concurrency'
+CONCURRENCY = [1, 10, 50, 200]
+DURATION = 10
+
+
+def headers():
+    credentials = '%s:%s' % (os.environ['USERNAME'], os.environ['PASSWORD'])
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': 'Basic %s' % base64.b64encode(credentials)
+    }
+
+
+def request(url, data=None):
+    response = urllib2.urlopen(urllib2.Request(url, data, headers()))
+    return response.read()
+
+
+def client(url, deadline, latencies, errors):
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            request(url)
+        except urllib2.HTTPError as error:
+            errors.append(error.code)
+            continue
+        latencies.append(time.time() - start)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(url, concurrency):
+    latencies = []
+    errors = []
+    deadline = time.time() + DURATION
+    threads = [threading.Thread(target=client,
+            args=(url, deadline, latencies, errors))
+        for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0, len(errors)
+    return (len(latencies) / float(DURATION),
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+        len(errors))
+
+
+def main(base_url):
+    list_url = '%s/api/checklist/%s' % (base_url, LIST_NAME)
+    for i in range(100):
+        request(list_url, '{"name": "task %s"}' % i)
+    print '%8s %10s %10s %10s %8s' % ('clients', 'req/s', 'p50 ms', 'p99 ms',
+        'errors')
+    for concurrency in CONCURRENCY:
+        print '%8d %10.1f %10.2f %10.2f %8d' % ((concurrency,) +
+            run(list_url, concurrency))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:8000')
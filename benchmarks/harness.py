@@ -0,0 +1,372 @@
+"""
+Load-test harness for the checklist API. Drives every TasksView and
+ProfilesView endpoint with a weighted mix of requests and reports
+throughput, p50/p95/p99 latency per endpoint and, when the app runs
+in-process, Redis commands and round trips per request.
+
+Run a scenario against the app in-process (uses the Redis at REDIS_URL):
+
+    python -m benchmarks.harness --scenario read-heavy --output results.json
+
+Set STORAGE=sqlite (and DATABASE_URL) to run the same scenarios against the
+SQL storage instead.
+
+Or against a running server, started with RATE_LIMIT_ENABLED=false so that
+requests are not throttled:
+
+    python -m benchmarks.harness --url http://localhost:8000
+
+Replay a recorded log of {"method", "path", "body"} lines instead:
+
+    python -m benchmarks.harness --replay requests.jsonl
+
+Pass --compare with an earlier --output file to print the change in
+throughput and p99 latency per scenario.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import time
+import urllib2
+from redis.connection import ConnectionPool
+
+
+SCENARIOS = {
+    'read-heavy': {
+        'list_size': 100,
+        'mix': {
+            'get_list': 30, 'get_page': 10, 'get_task': 30,
+            'get_profile': 10, 'get_profile_expanded': 5,
+            'post_task': 5, 'patch_task': 5, 'delete_task': 5,
+        },
+    },
+    'write-heavy': {
+        'list_size': 100,
+        'mix': {
+            'post_task': 25, 'patch_task': 25, 'delete_task': 10,
+            'bulk': 5, 'put_profile': 5, 'patch_profile': 5,
+            'delete_profile': 5, 'get_task': 10, 'get_list': 10,
+        },
+    },
+    'large-lists': {
+        'list_size': 5000,
+        'mix': {
+            'get_list': 30, 'get_page': 30, 'stream_list': 20,
+            'get_profile_expanded': 10, 'post_task': 10,
+        },
+    },
+}
+
+
+class CountingConnection(object):
+    """
+    Counts the commands and round trips sent by the in-process app. Mixed
+    into the app's own connection class, so its settings still apply.
+    """
+    commands = 0
+    round_trips = 0
+
+    def pack_command(self, *args):
+        CountingConnection.commands += 1
+        return super(CountingConnection, self).pack_command(*args)
+
+    def send_packed_command(self, command):
+        CountingConnection.round_trips += 1
+        return super(CountingConnection, self).send_packed_command(command)
+
+
+class LocalClient():
+    def __init__(self):
+        from app.factory import create_app
+        from app.core import redis, sql, rate_limiter
+        app = create_app()
+        rate_limiter.enabled = False
+        self.app = app.test_client()
+        self.storage = app.config['STORAGE']
+        self.counts_commands = self.storage != 'sqlite'
+        self.redis = redis
+        self.sql = sql
+        pool = redis.connection.connection_pool
+        connection_class = type('Counting' + pool.connection_class.__name__,
+            (CountingConnection, pool.connection_class), {})
+        redis.connection.connection_pool = ConnectionPool(
+            connection_class=connection_class,
+            max_connections=pool.max_connections, **pool.connection_kwargs)
+
+    def request(self, method, path, body=None):
+        response = self.app.open(path, method=method, headers=auth_headers(),
+            data=json.dumps(body) if body is not None else None)
+        return response.status_code, response.data
+
+    def cleanup(self, name):
+        if self.storage == 'sqlite':
+            return self._cleanup_sql(name)
+        from app.core import search_index
+        search_index.remove_list(name)
+        keys = list(self.redis.scan_iter(match='%s:*' % name))
+        keys += list(self.redis.scan_iter(match='profile:%s*' % name))
+        if keys:
+            self.redis.delete(*keys)
+
+    def _cleanup_sql(self, name):
+        from app.sql import tasks, lists, profiles, profile_lists
+        with self.sql.engine.begin() as connection:
+            for table, column in ((tasks, tasks.c.list_name),
+                    (lists, lists.c.list_name), (profiles, profiles.c.name),
+                    (profile_lists, profile_lists.c.profile)):
+                connection.execute(table.delete().where(column == name))
+
+
+class RemoteClient():
+    counts_commands = False
+    storage = None
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body) if body is not None else None
+        request = urllib2.Request(self.base_url + path, data, auth_headers())
+        request.get_method = lambda: method
+        try:
+            response = urllib2.urlopen(request)
+            return response.getcode(), response.read()
+        except urllib2.HTTPError as error:
+            return error.code, error.read()
+
+    def cleanup(self, name):
+        pass
+
+
+class Benchmark():
+    def __init__(self, client):
+        self.client = client
+        self.latencies = {}
+        self.rate_limited = 0
+        self.list_name = 'bench-%d' % (time.time() * 1000)
+        self.ids = []
+
+    def call(self, label, method, path, body=None):
+        start = time.time()
+        status, data = self.client.request(method, path, body)
+        self.latencies.setdefault(label, []).append(time.time() - start)
+        if status == 429:
+            self.rate_limited += 1
+        return status, data
+
+    def setup(self, list_size):
+        for start in range(0, list_size, 1000):
+            operations = [{'op': 'create', 'task': {'name': 'task %d' % i}}
+                for i in range(start, min(start + 1000, list_size))]
+            _, data = self.client.request('POST', self._list_path('_bulk'),
+                operations)
+            self.ids.extend(item['id'] for item in json.loads(data)['results'])
+        self.client.request('POST', self._profile_path(),
+            {'lists': [self.list_name]})
+
+    def run_mix(self, mix, requests):
+        operations = []
+        for name, weight in sorted(mix.items()):
+            operations.extend([getattr(self, name)] * weight)
+        for _ in range(requests):
+            random.choice(operations)()
+
+    def replay(self, path):
+        with open(path) as log:
+            for line in log:
+                entry = json.loads(line)
+                label = entry.get('label', '%s %s' % (entry['method'],
+                    entry['path'].split('?')[0]))
+                self.call(label, entry['method'], entry['path'],
+                    entry.get('body'))
+
+    def get_list(self):
+        self.call('get_list', 'GET', self._list_path())
+
+    def get_page(self):
+        self.call('get_page', 'GET', self._list_path() + '?limit=50')
+
+    def stream_list(self):
+        self.call('stream_list', 'GET', self._list_path() + '?stream=json')
+
+    def get_task(self):
+        self.call('get_task', 'GET', self._list_path(self._random_id()))
+
+    def post_task(self):
+        status, data = self.call('post_task', 'POST', self._list_path(),
+            {'name': 'new task'})
+        if status == 201:
+            self.ids.append(int(json.loads(data).keys()[0]))
+
+    def patch_task(self):
+        self.call('patch_task', 'PATCH', self._list_path(self._random_id()),
+            {'done': True})
+
+    def delete_task(self):
+        if len(self.ids) > 1:
+            id_number = self.ids.pop(random.randrange(len(self.ids)))
+            self.call('delete_task', 'DELETE', self._list_path(id_number))
+
+    def bulk(self):
+        operations = [{'op': 'create', 'task': {'name': 'bulk task'}}] * 5
+        operations += [{'op': 'update', 'id': self._random_id(),
+            'task': {'done': False}} for _ in range(5)]
+        status, data = self.call('bulk', 'POST', self._list_path('_bulk'),
+            operations)
+        if status != 200:
+            return
+        self.ids.extend(item['id'] for item in json.loads(data)['results']
+            if item['status'] == 201)
+
+    def get_profile(self):
+        self.call('get_profile', 'GET', self._profile_path())
+
+    def get_profile_expanded(self):
+        self.call('get_profile_expanded', 'GET',
+            self._profile_path() + '?expand=tasks')
+
+    def put_profile(self):
+        self.call('put_profile', 'PUT', self._profile_path(),
+            {'lists': [self.list_name, 'other']})
+
+    def patch_profile(self):
+        self.call('patch_profile', 'PATCH', self._profile_path(),
+            {'add': ['extra'], 'remove': ['other']})
+
+    def delete_profile(self):
+        self.call('delete_profile', 'DELETE', self._profile_path())
+        self.call('post_profile', 'POST', self._profile_path(),
+            {'lists': [self.list_name]})
+
+    def _random_id(self):
+        return random.choice(self.ids)
+
+    def _list_path(self, suffix=None):
+        path = '/api/checklist/%s' % self.list_name
+        return path if suffix is None else '%s/%s' % (path, suffix)
+
+    def _profile_path(self):
+        return '/api/profile/%s' % self.list_name
+
+
+def auth_headers():
+    credentials = '%s:%s' % (os.environ['USERNAME'], os.environ['PASSWORD'])
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': 'Basic %s' % base64.b64encode(credentials)
+    }
+
+
+def summarise(latencies):
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        index = min(len(latencies) - 1, int(len(latencies) * fraction))
+        return round(latencies[index] * 1000, 3)
+
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def report(name, benchmark, duration, commands, round_trips):
+    all_latencies = sum(benchmark.latencies.values(), [])
+    requests = len(all_latencies)
+    result = dict(summarise(all_latencies), scenario=name,
+        storage=benchmark.client.storage,
+        throughput=round(requests / duration, 1),
+        rate_limited=benchmark.rate_limited,
+        endpoints=dict((label, summarise(latencies))
+            for label, latencies in benchmark.latencies.items()))
+    if benchmark.client.counts_commands:
+        result['commands_per_request'] = round(commands / float(requests), 2)
+        result['round_trips_per_request'] = round(
+            round_trips / float(requests), 2)
+    return result
+
+
+def print_report(result):
+    print '%s: %d requests, %.1f req/s' % (result['scenario'],
+        result['count'], result['throughput'])
+    if result.get('storage'):
+        print '  storage: %s' % result['storage']
+    if result.get('rate_limited'):
+        print '  %d requests were rate limited' % result['rate_limited']
+    if 'commands_per_request' in result:
+        print '  redis: %.2f commands, %.2f round trips per request' % (
+            result['commands_per_request'], result['round_trips_per_request'])
+    print '  %-22s %8s %9s %9s %9s' % ('endpoint', 'count', 'p50 ms',
+        'p95 ms', 'p99 ms')
+    for label, stats in sorted(result['endpoints'].items()):
+        print '  %-22s %8d %9.2f %9.2f %9.2f' % (label, stats['count'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'])
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = dict((result['scenario'], result)
+            for result in json.load(baseline_file)['results'])
+    for result in results:
+        before = baseline.get(result['scenario'])
+        if before is None:
+            continue
+        print '%s vs baseline: throughput %+.1f%%, p99 %+.1f%%' % (
+            result['scenario'],
+            change(before['throughput'], result['throughput']),
+            change(before['p99_ms'], result['p99_ms']))
+
+
+def change(before, after):
+    return (after - before) * 100.0 / before if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scenario', action='append',
+        choices=sorted(SCENARIOS), help='defaults to every scenario')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--url', help='benchmark a running server')
+    parser.add_argument('--replay', help='replay a JSONL request log')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    args = parser.parse_args()
+
+    client = RemoteClient(args.url) if args.url else LocalClient()
+    runs = [('replay', None)] if args.replay else [(name, SCENARIOS[name])
+        for name in args.scenario or sorted(SCENARIOS)]
+    results = []
+    for name, scenario in runs:
+        benchmark = Benchmark(client)
+        if scenario is not None:
+            benchmark.setup(scenario['list_size'])
+        commands = CountingConnection.commands
+        round_trips = CountingConnection.round_trips
+        start = time.time()
+        if scenario is None:
+            benchmark.replay(args.replay)
+        else:
+            benchmark.run_mix(scenario['mix'], args.requests)
+        duration = time.time() - start
+        result = report(name, benchmark, duration,
+            CountingConnection.commands - commands,
+            CountingConnection.round_trips - round_trips)
+        print_report(result)
+        results.append(result)
+        client.cleanup(benchmark.list_name)
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'timestamp': int(time.time()), 'results': results},
+                output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares the latency of fetching a whole list one task at a time against
+the pipelined TaskManager.all. Needs a local redis-server.
+
+    python -m benchmarks.list_fetch
+"""
+import timeit
+from redis import StrictRedis
+from app.models import IndexManager, SearchIndex
+from app.tasks.models import TaskManager
+
+
+LIST_NAME = 'benchmark:list_fetch'
+LIST_SIZES = [10, 100, 1000, 5000]
+REPEAT = 5
+
+
+def fill(task_manager, size):
+    for i in range(size):
+        task_manager.create(LIST_NAME, {'name': 'task %s' % i, 'done': i % 2 == 0})
+
+
+def clear(db):
+    SearchIndex(db=db).remove_list(LIST_NAME)
+    for key in db.keys('%s:*' % LIST_NAME):
+        db.delete(key)
+
+
+def one_by_one(task_manager):
+    objects = {}
+    for id_number in task_manager.index.get(LIST_NAME):
+        objects[id_number] = task_manager.get(LIST_NAME, id_number)
+    return objects
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+    db = StrictRedis()
+    task_manager = TaskManager(db=db, index=IndexManager(db=db))
+    print '%8s %14s %14s' % ('tasks', 'one-by-one ms', 'pipelined ms')
+    for size in LIST_SIZES:
+        clear(db)
+        fill(task_manager, size)
+        assert one_by_one(task_manager) == task_manager.all(LIST_NAME)
+        print '%8d %14.2f %14.2f' % (
+            size,
+            best_of(lambda: one_by_one(task_manager)),
+            best_of(lambda: task_manager.all(LIST_NAME))
+        )
+    clear(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Measures the per-request cost of rate limiting in-process by sending the
+same cheap request with the limiter off and on, and reports the Redis
+round trips each request makes. Needs a local redis-server; limits are
+raised so that no request is throttled and a `benchmark-user` user is
+created and removed.
+
+    python -m benchmarks.ratelimit
+"""
+import base64
+import re
+import timeit
+from app.factory import create_app
+from app.core import rate_limiter, redis, user_manager, metrics
+
+
+REQUESTS = 200
+REPEAT = 5
+USERNAME = 'benchmark-user'
+PASSWORD = 'benchmark password'
+PATH = '/api/checklist/benchmark:ratelimit/_count'
+HEADERS = {'Authorization': 'Basic %s' %
+    base64.b64encode('%s:%s' % (USERNAME, PASSWORD))}
+
+
+def per_request(client):
+    timings = timeit.repeat(lambda: client.get(PATH, headers=HEADERS),
+        number=REQUESTS, repeat=REPEAT)
+    return min(timings) / REQUESTS * 1000
+
+
+def round_trips(client):
+    timing = client.get(PATH, headers=HEADERS).headers['Server-Timing']
+    return int(re.search(r'(\d+) round trips', timing).group(1))
+
+
+def main():
+    client = create_app().test_client()
+    metrics.sample_rate = 1.0
+    rate_limiter.limits = dict((name, (1000000, 1000000))
+        for name in rate_limiter.limits)
+    user_manager.create(USERNAME, PASSWORD)
+    results = []
+    try:
+        for enabled in (False, True):
+            rate_limiter.enabled = enabled
+            results.append(('on' if enabled else 'off', per_request(client),
+                round_trips(client)))
+    finally:
+        user_manager.delete(USERNAME)
+        redis.delete('ratelimit:%s:TasksView:count' % USERNAME)
+    print '%-12s %10s %12s' % ('limiter', 'ms/request', 'round trips')
+    for label, duration, trips in results:
+        print '%-12s %10.3f %12d' % (label, duration, trips)
+
+
+if __name__ == '__main__':
+    main()
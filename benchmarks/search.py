@@ -0,0 +1,67 @@
+"""
+Measures search latency against the number of indexed tasks, for one and
+two word queries, across all lists and scoped to one list. Needs a local
+redis-server; the corpus is written to and removed from lists named
+`benchmark:search:*`.
+
+    python -m benchmarks.search
+"""
+import random
+import timeit
+from redis import StrictRedis
+from app.models import IndexManager, SearchIndex
+from app.tasks.models import TaskManager
+
+
+CORPUS_SIZES = [1000, 10000, 100000]
+LISTS = 10
+REPEAT = 20
+BATCH = 1000
+WORDS = ('buy milk bread call mum book flights pay rent fix bike clean '
+    'kitchen water plants write report review code walk dog renew '
+    'passport email landlord pick up parcel cancel gym').split()
+QUERIES = [('one word', 'milk'), ('two words', 'review report')]
+
+
+def fill(task_manager, size):
+    random.seed(size)
+    for start in range(0, size, BATCH):
+        list_name = 'benchmark:search:%d' % (start // BATCH % LISTS)
+        task_manager.bulk(list_name, [
+            ('create', None, {'name': ' '.join(random.sample(WORDS, 3))})
+            for _ in range(start, min(start + BATCH, size))
+        ])
+
+
+def clear(db, search_index):
+    for list_number in range(LISTS):
+        list_name = 'benchmark:search:%d' % list_number
+        search_index.remove_list(list_name)
+        keys = list(db.scan_iter(match='%s:*' % list_name))
+        for start in range(0, len(keys), BATCH):
+            db.delete(*keys[start:start + BATCH])
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+    db = StrictRedis()
+    search_index = SearchIndex(db=db)
+    task_manager = TaskManager(db=db, index=IndexManager(db=db),
+        search=search_index)
+    print '%8s %-10s %12s %12s' % ('tasks', 'query', 'all ms', 'list ms')
+    for size in CORPUS_SIZES:
+        clear(db, search_index)
+        fill(task_manager, size)
+        for label, query in QUERIES:
+            print '%8d %-10s %12.3f %12.3f' % (size, label,
+                best_of(lambda: task_manager.search(query)),
+                best_of(lambda: task_manager.search(query,
+                    ['benchmark:search:0'])))
+        clear(db, search_index)
+
+
+if __name__ == '__main__':
+    main()
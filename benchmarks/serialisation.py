@@ -0,0 +1,61 @@
+"""
+Microbenchmarks for the CPU spent encoding large list responses and
+validating request bodies. Compares Flask's jsonify with app.responses,
+using the standard library encoder and ujson when it is installed. Does
+not need Redis.
+
+    python -m benchmarks.serialisation
+"""
+import json
+import timeit
+from flask import Flask, current_app, jsonify
+from app import responses
+from app.models import TaskValidator, BulkOperationValidator
+
+
+LIST_SIZES = [100, 1000, 10000]
+REPEAT = 5
+
+
+def tasks(size):
+    return dict((str(i), {'name': 'task number %d' % i, 'done': i % 2 == 0})
+        for i in range(1, size + 1))
+
+
+def best_of(func, number=1):
+    return min(timeit.repeat(func, number=number, repeat=REPEAT)) * 1000 / \
+        number
+
+
+def stdlib_response(obj):
+    return current_app.response_class(
+        json.dumps(obj, separators=(',', ':')), mimetype='application/json')
+
+
+def main():
+    app = Flask(__name__)
+    encoders = [('jsonify', jsonify), ('stdlib', stdlib_response)]
+    if responses.ujson is not None:
+        encoders.append(('ujson', responses.json_response))
+    with app.test_request_context():
+        print '%8s %-10s %10s %10s' % ('tasks', 'encoder', 'ms', 'bytes')
+        for size in LIST_SIZES:
+            objects = tasks(size)
+            for label, encoder in encoders:
+                print '%8d %-10s %10.3f %10d' % (size, label,
+                    best_of(lambda: encoder(objects)),
+                    len(encoder(objects).data))
+    task = {'name': u'task', 'done': True}
+    operation = {'op': u'update', 'id': 1, 'task': task}
+    task_validator = TaskValidator()
+    bulk_validator = BulkOperationValidator()
+    print
+    print '%-28s %10s' % ('validator', 'us/call')
+    print '%-28s %10.3f' % ('task', 1000 * best_of(
+        lambda: task_validator.validate(task, ['name']), number=10000))
+    print '%-28s %10.3f' % ('bulk operation', 1000 * best_of(
+        lambda: bulk_validator.validate(operation), number=10000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares Redis memory use and read latency of the one-hash-per-task
+layout (TaskManager) against the packed bucket layout (PackedTaskManager).
+Needs a local redis-server; memory is read from INFO, so run it against
+an otherwise idle instance.
+
+    python -m benchmarks.storage
+"""
+import timeit
+from redis import StrictRedis
+from app.models import IndexManager, SearchIndex
+from app.tasks.models import TaskManager, PackedTaskManager
+
+
+LIST_SIZES = [1000, 10000, 100000]
+REPEAT = 5
+BATCH = 1000
+
+
+def used_memory(db):
+    return db.info('memory')['used_memory']
+
+
+def fill(task_manager, list_name, size):
+    for start in range(0, size, BATCH):
+        task_manager.bulk(list_name, [
+            ('create', None, {'name': 'task number %d' % i, 'done': i % 2 == 0})
+            for i in range(start, min(start + BATCH, size))
+        ])
+
+
+def clear(db, list_name):
+    SearchIndex(db=db).remove_list(list_name)
+    keys = list(db.scan_iter(match='%s:*' % list_name))
+    for start in range(0, len(keys), BATCH):
+        db.delete(*keys[start:start + BATCH])
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def measure(db, manager_class, size):
+    list_name = 'benchmark:storage'
+    task_manager = manager_class(db=db, index=IndexManager(db=db))
+    clear(db, list_name)
+    before = used_memory(db)
+    fill(task_manager, list_name, size)
+    memory = used_memory(db) - before
+    result = (
+        memory / float(size),
+        best_of(lambda: task_manager.all(list_name)),
+        best_of(lambda: task_manager.get(list_name, size // 2)),
+    )
+    clear(db, list_name)
+    return result
+
+
+def main():
+    db = StrictRedis()
+    print '%8s %-10s %14s %10s %10s' % ('tasks', 'layout', 'bytes/task',
+        'all ms', 'get ms')
+    for size in LIST_SIZES:
+        for name, manager_class in (('hash', TaskManager),
+                ('packed', PackedTaskManager)):
+            print '%8d %-10s %14.1f %10.2f %10.3f' % ((size, name) +
+                measure(db, manager_class, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,53 @@ class Config(object):
 	DEBUG = False
 	TESTING = False
 	CSRF_ENABLED = True
+	MAX_PAGE_SIZE = 1000
+	MAX_BULK_OPERATIONS = 1000
+	MAX_EXPANDED_TASKS = 100
+	MAX_LIST_SIZE = int(os.environ.get('MAX_LIST_SIZE', 0))
+	STREAM_BATCH_SIZE = 500
+	SEARCH_PAGE_SIZE = 20
+	CHANGE_LOG_SIZE = 1000
+	EVENTS_KEEPALIVE = 15
+	CACHE_ENABLED = os.environ.get('CACHE_ENABLED') == 'true'
+	CACHE_MAX_SIZE = 10000
+	CACHE_TTL = 5
+	REDIS_CLUSTER = os.environ.get('REDIS_CLUSTER') == 'true'
+	REDIS_CLASS = 'app.connections.ClusterRedis' if REDIS_CLUSTER \
+		else 'app.connections.ReplicatedRedis'
+	REDIS_MAX_CONNECTIONS = 50
+	REDIS_POOL_TIMEOUT = 5
+	REDIS_SOCKET_TIMEOUT = 5
+	REDIS_SOCKET_CONNECT_TIMEOUT = 2
+	REDIS_CONNECT_RETRIES = 3
+	REDIS_RETRY_BACKOFF = 0.05
+	REDIS_REPLICA_URL = os.environ.get('REDIS_REPLICA_URL')
+	REDIS_SENTINELS = os.environ.get('REDIS_SENTINELS')
+	REDIS_SENTINEL_SERVICE = os.environ.get('REDIS_SENTINEL_SERVICE',
+		'mymaster')
+	COMPRESSION_ENABLED = True
+	COMPRESSION_MIN_SIZE = 1024
+	GZIP_LEVEL = 6
+	BROTLI_QUALITY = 4
+	RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true') == 'true'
+	RATE_LIMITS = {
+		'read': (50, 100),
+		'write': (20, 40),
+		'bulk': (2, 10),
+		'search': (10, 20)
+	}
+	METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.01))
+	STORAGE = os.environ.get('STORAGE', 'redis')
+	TASK_STORAGE = os.environ.get('TASK_STORAGE', 'hash')
+	SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL',
+		'sqlite:///checklist.db')
+	SECRET_KEY = os.environ.get('SECRET_KEY')
+	USERNAME = os.environ.get('USERNAME')
+	PASSWORD = os.environ.get('PASSWORD')
+	TOKEN_TTL = 600
+	AUTH_CACHE_ENABLED = True
+	AUTH_CACHE_MAX_SIZE = 10000
+	AUTH_CACHE_TTL = 60
 
 class ProductionConfig(Config):
 	REDIS_URL = os.environ.get('REDISCLOUD_URL')
@@ -13,4 +60,6 @@ class DevelopmentConfig(Config):
 	REDIS_URL = os.environ.get('REDIS_URL')
 	DEVELOPMENT = True
 	DEBUG = True
+	METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+	SECRET_KEY = os.environ.get('SECRET_KEY', 'development')
 
@@ -0,0 +1,5 @@
+from gevent import monkey
+monkey.patch_all()
+
+from app.factory import create_gevent_app
+app = create_gevent_app()